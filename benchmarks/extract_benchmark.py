@@ -0,0 +1,88 @@
+"""
+Benchmark the process-pool HTML extraction stage.
+
+Runs ExtractionPool over a fixed corpus of HTML pages with 1..N worker
+processes and reports pages/sec for each core count. Pass ``--html-dir`` to
+use saved pages instead of the synthetic corpus.
+
+    python benchmarks/extract_benchmark.py --pages 200 --max-workers 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from integrata_extract import ExtractionPool, extract_text
+
+WORDS = (
+    "llama model search result page content summary token latency throughput "
+    "cache request server network article paragraph example information"
+).split()
+
+
+def synthetic_page(rng: random.Random, paragraphs: int = 60) -> str:
+    """A news-article-shaped page with navigation and footer boilerplate."""
+    nav = "".join(f"<li><a href='/s{i}'>Section {i}</a></li>" for i in range(30))
+    body = "".join(
+        "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + "</p>"
+        for _ in range(paragraphs)
+    )
+    footer = "".join(f"<a href='/f{i}'>Footer link {i}</a> " for i in range(40))
+    return (
+        "<html><head><title>Benchmark page</title><script>var x = 1;</script></head><body>"
+        f"<nav><ul>{nav}</ul></nav><article><h1>Headline</h1>{body}</article>"
+        f"<footer>{footer}</footer></body></html>"
+    )
+
+
+def load_corpus(args) -> list:
+    if args.html_dir:
+        pages = []
+        for name in sorted(os.listdir(args.html_dir)):
+            with open(os.path.join(args.html_dir, name), encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+        return pages
+    rng = random.Random(args.seed)
+    return [synthetic_page(rng) for _ in range(args.pages)]
+
+
+def run(pool: ExtractionPool, pages: list) -> float:
+    start = time.perf_counter()
+    futures = [pool.submit(html) for html in pages]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=200, help="synthetic pages to extract")
+    parser.add_argument("--html-dir", help="directory of saved .html pages to use instead")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = load_corpus(args)
+    start = time.perf_counter()
+    for html in pages:
+        extract_text(html)
+    inline = time.perf_counter() - start
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.1f} KB avg")
+    print(f"{'workers':>8} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+    print(f"{'inline':>8} {inline:9.2f} {len(pages) / inline:9.1f} {1.0:8.2f}")
+
+    counts = sorted({1 << i for i in range(args.max_workers.bit_length())} | {args.max_workers})
+    for workers in counts:
+        pool = ExtractionPool(workers=workers)
+        pool.extract(pages[0])  # start the worker processes outside the timing
+        elapsed = run(pool, pages)
+        pool.shutdown()
+        print(f"{workers:>8} {elapsed:9.2f} {len(pages) / elapsed:9.1f} {inline / elapsed:8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
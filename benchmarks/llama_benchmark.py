@@ -0,0 +1,249 @@
+"""
+Benchmark IntegrataLlama end to end without network access or an API key.
+
+Starts a mock Llama API and a mock web server (see mock_servers.py) with the
+requested latency, jitter and error rate, points IntegrataLlama at them and
+runs each scenario, reporting throughput, p50/p99 latency and the peak RSS
+of this process while the scenario ran:
+
+    chat            IntegrataLlama.chat() from a thread pool
+    web_search      IntegrataLlama.web_search(), one query at a time
+    async_batch     async_chat() calls driven by async_batch_runner
+    api_chat        POST /chat through the FastAPI app
+    api_web_search  POST /web_search through the FastAPI app
+
+Completion caching is turned off and every query is distinct, so each
+operation really goes through the mocks.
+
+    python benchmarks/llama_benchmark.py --requests 200 --llm-latency 0.05 --llm-error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mock_servers import MockLlamaServer, MockWebServer
+
+SCENARIOS = ("chat", "web_search", "async_batch", "api_chat", "api_web_search")
+
+
+class RssSampler:
+    """Track the peak resident set size of this process while in the ``with`` block."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current_kb() -> int:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        # ru_maxrss is the lifetime peak (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, self.current_kb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_kb = self.current_kb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, self.current_kb())
+        return False
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def report(name: str, latencies: list, errors: int, elapsed: float, peak_kb: int) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "scenario": name,
+        "ops": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_mb": peak_kb / 1024,
+    }
+
+
+def run_threaded(fn, count: int, concurrency: int):
+    """Call ``fn(i)`` for i in range(count) on ``concurrency`` threads; return (latencies, errors)."""
+    latencies, errors = [], 0
+
+    def timed(i):
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(timed, i) for i in range(count)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return latencies, errors
+
+
+async def run_async(fn, count: int, concurrency: int):
+    """Await ``fn(i)`` for i in range(count), at most ``concurrency`` at once."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed(i):
+        async with slots:
+            start = time.perf_counter()
+            await fn(i)
+            return time.perf_counter() - start
+
+    outcomes = await asyncio.gather(*(timed(i) for i in range(count)), return_exceptions=True)
+    latencies = [o for o in outcomes if not isinstance(o, BaseException)]
+    return latencies, len(outcomes) - len(latencies)
+
+
+def scenario_runners(api, llama, args):
+    from httpx import ASGITransport, AsyncClient
+    from integrata_concurrency import async_batch_runner
+
+    search_options = dict(max_results=args.results, concurrency=args.results, use_cache=False)
+
+    def chat():
+        return run_threaded(lambda i: llama.chat(f"benchmark message {i}", use_cache=False),
+                            args.requests, args.concurrency)
+
+    def web_search():
+        def search(i):
+            if any("error" in r for r in llama.web_search(f"web query {i}", **search_options)):
+                raise RuntimeError("a summary failed")
+        return run_threaded(search, args.searches, 1)
+
+    def async_batch():
+        async def main():
+            latencies = []
+
+            def timed_chat(i):
+                async def call():
+                    start = time.perf_counter()
+                    await llama.async_chat(f"batch message {i}", use_cache=False)
+                    latencies.append(time.perf_counter() - start)
+                return call
+
+            outcomes = await async_batch_runner(
+                [timed_chat(i) for i in range(args.requests)], batch_size=args.concurrency, max_loops=1
+            )
+            return latencies, sum(isinstance(o, Exception) for o in outcomes)
+        return asyncio.run(main())
+
+    def api_run(path, payload, count, concurrency):
+        async def main():
+            async with AsyncClient(transport=ASGITransport(app=api.app), base_url="http://bench", timeout=None) as client:
+                async def call(i):
+                    response = await client.post(path, json=payload(i))
+                    response.raise_for_status()
+                return await run_async(call, count, concurrency)
+        return asyncio.run(main())
+
+    def api_chat():
+        return api_run("/chat", lambda i: {"message": f"api message {i}", "use_cache": False},
+                       args.requests, args.concurrency)
+
+    def api_web_search():
+        return api_run("/web_search", lambda i: {"query": f"api query {i}", **search_options},
+                       args.searches, 1)
+
+    return {
+        "chat": chat, "web_search": web_search, "async_batch": async_batch,
+        "api_chat": api_chat, "api_web_search": api_web_search,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="chat calls per chat scenario")
+    parser.add_argument("--searches", type=int, default=10, help="searches per web search scenario")
+    parser.add_argument("--results", type=int, default=8, help="results summarized per search")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="mock Llama API latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.01)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--web-latency", type=float, default=0.02, help="mock web server latency in seconds")
+    parser.add_argument("--web-jitter", type=float, default=0.005)
+    parser.add_argument("--web-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    llama_server = MockLlamaServer(args.llm_latency, args.llm_jitter, args.llm_error_rate, seed=args.seed).start()
+    web_server = MockWebServer(args.web_latency, args.web_jitter, args.web_error_rate, seed=args.seed + 1).start()
+
+    # The SDK and the caches read these at construction/import time
+    os.environ["LLAMA_API_KEY"] = "benchmark"
+    os.environ["LLAMA_API_CLIENT_BASE_URL"] = llama_server.base_url
+    os.environ["INTEGRATA_CACHE_DIR"] = tempfile.mkdtemp(prefix="integrata_bench_")
+    import integrata_llama
+    import integrata_llama_api as api
+    integrata_llama._ddgs_text = web_server.hits
+    llama = api.llama
+    # Keep failures cheap to retry so error-rate runs measure the retry path, not the sleep
+    llama.rate_limiter.base_delay = 0.01
+
+    runners = scenario_runners(api, llama, args)
+    results = []
+    print(f"{'scenario':<16} {'ops':>6} {'errors':>6} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    try:
+        for name in names:
+            with RssSampler() as rss:
+                start = time.perf_counter()
+                latencies, errors = runners[name]()
+                elapsed = time.perf_counter() - start
+            row = report(name, latencies, errors, elapsed, rss.peak_kb)
+            results.append(row)
+            print(f"{name:<16} {row['ops']:>6} {errors:>6} {row['ops_per_sec']:9.1f} "
+                  f"{row['p50_ms']:9.1f} {row['p99_ms']:9.1f} {row['peak_rss_mb']:12.1f}")
+    finally:
+        llama.extractor.shutdown()
+        llama_server.stop()
+        web_server.stop()
+
+    print(f"mock Llama API: {llama_server.behaviour.requests} requests, {llama_server.behaviour.errors} injected errors; "
+          f"mock web: {web_server.behaviour.requests} requests, {web_server.behaviour.errors} injected errors")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
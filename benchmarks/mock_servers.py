@@ -0,0 +1,199 @@
+"""
+Local stand-ins for the Llama API and for the web, for offline benchmarks.
+
+Both servers run on a background thread, bind to 127.0.0.1 on a free port,
+and delay every response by ``latency`` seconds give or take a normally
+distributed ``jitter``. A fraction ``error_rate`` of requests fail with
+``error_status``. The same ``seed`` gives the same sequence of delays and
+failures.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from extract_benchmark import synthetic_page
+
+SUMMARY_TEXT = (
+    "This page explains how the service batches requests, caches responses and "
+    "bounds concurrency so that latency stays predictable under load."
+)
+
+
+class _Behaviour:
+    """Seeded latency and failure schedule shared by a server's handler threads."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, error_status: int, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next(self):
+        """Return ``(delay, fail)`` for the next request."""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            fail = self._rng.random() < self.error_rate
+            self.errors += fail
+            return delay, fail
+
+
+class _MockServer:
+    handler = BaseHTTPRequestHandler
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, seed: int = 0):
+        self.behaviour = _Behaviour(latency, jitter, error_rate, error_status, seed)
+        handler = type(self.handler.__name__, (self.handler,), {"behaviour": self.behaviour})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "_MockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    behaviour: _Behaviour
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the request
+
+
+    def _delay_or_fail(self) -> bool:
+        """Sleep for the scheduled latency; send the scheduled error and return True if this request fails."""
+        delay, fail = self.behaviour.next()
+        time.sleep(delay)
+        if fail:
+            body = json.dumps({"error": {"message": "mock upstream error"}}).encode()
+            self._send(self.behaviour.error_status, body, "application/json", {"Retry-After": "0"})
+        return fail
+
+
+def _metrics(prompt_tokens: int, completion_tokens: int) -> list:
+    return [
+        {"metric": "num_prompt_tokens", "value": prompt_tokens, "unit": "tokens"},
+        {"metric": "num_completion_tokens", "value": completion_tokens, "unit": "tokens"},
+        {"metric": "num_total_tokens", "value": prompt_tokens + completion_tokens, "unit": "tokens"},
+    ]
+
+
+class _LlamaHandler(_Handler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        params = json.loads(self.rfile.read(length) or b"{}")
+        if self._delay_or_fail():
+            return
+        if self.path.endswith("/moderations"):
+            body = {"model": "Llama-Guard-4-12B", "results": [{"flagged": False, "flagged_categories": []}]}
+            self._send(200, json.dumps(body).encode(), "application/json")
+        elif self.path.endswith("/chat/completions"):
+            prompt = json.dumps(params.get("messages", []))
+            usage = _metrics(len(prompt) // 4, len(SUMMARY_TEXT) // 4)
+            if params.get("stream"):
+                self._stream(usage)
+            else:
+                body = {
+                    "id": "mock",
+                    "completion_message": {
+                        "role": "assistant",
+                        "content": {"type": "text", "text": SUMMARY_TEXT},
+                        "stop_reason": "stop",
+                    },
+                    "metrics": usage,
+                }
+                self._send(200, json.dumps(body).encode(), "application/json")
+        else:
+            self._send(404, b"{}", "application/json")
+
+    def _stream(self, usage: list):
+        events = [{"event_type": "start", "delta": {"type": "text", "text": ""}}]
+        events += [{"event_type": "progress", "delta": {"type": "text", "text": word + " "}}
+                   for word in SUMMARY_TEXT.split()]
+        events.append({"event_type": "metrics", "delta": {"type": "text", "text": ""}, "metrics": usage})
+        events.append({"event_type": "complete", "delta": {"type": "text", "text": ""}, "stop_reason": "stop"})
+        body = "".join(f"data: {json.dumps({'event': event})}\n\n" for event in events).encode()
+        self._send(200, body, "text/event-stream")
+
+
+class MockLlamaServer(_MockServer):
+    """
+    Answers /v1/chat/completions (plain and streamed) and /v1/moderations with
+    canned responses that carry token metrics. Point the SDK at it with
+    LLAMA_API_CLIENT_BASE_URL=<server.base_url>.
+    """
+
+    handler = _LlamaHandler
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "/v1"
+
+
+class _WebHandler(_Handler):
+    pages: dict = {}
+
+    def do_GET(self):
+        if self._delay_or_fail():
+            return
+        self._send(200, self.page(self.path).encode(), "text/html; charset=utf-8")
+
+    @classmethod
+    def page(cls, path: str) -> str:
+        # Pages are generated once per path, deterministically, and reused
+        html = cls.pages.get(path)
+        if html is None:
+            html = cls.pages[path] = synthetic_page(random.Random(path))
+        return html
+
+
+class MockWebServer(_MockServer):
+    """Serves a synthetic article page for every path."""
+
+    handler = _WebHandler
+
+    def hits(self, query: str, max_results: int) -> list:
+        """DuckDuckGo-shaped results for ``query`` that link to this server."""
+        slug = "-".join(query.split())
+        return [
+            {"title": f"{query} result {i}", "href": f"{self.url}/{slug}/{i}", "body": f"Snippet {i} for {query}."}
+            for i in range(max_results)
+        ]
@@ -2,84 +2,30 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext
 import threading
 import queue
-import requests
-from readability import Document
-from ddgs import DDGS
 import asyncio
 import os
 import sys
-from typing import Any, Awaitable, Callable, List, Optional, Dict
 import time
 import webbrowser
 import json
+from collections import deque
 from datetime import datetime
 import psutil
-import tiktoken
 
-# Import the llama client
-from llama_api_client import AsyncLlamaAPIClient
+# Make the shared integrata_* helpers importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from integrata_concurrency import ProgressTracker, async_batch_runner
+from integrata_metrics import QuantileSketch, RollingRate
+from integrata_search import SearchStack
+from integrata_tokens import UsageTracker, truncate_tokens
 
-# Copy the concurrent utilities directly here
-class ProgressTracker:
-    def __init__(self):
-        self.calls_sent = 0
-        self.calls_completed = 0
-        self.errors = 0
-        self.callbacks = []
-
-    def register_callback(self, callback: Callable[[Dict[str, int]], None]):
-        self.callbacks.append(callback)
-
-    def update(self, sent=0, completed=0, errors=0):
-        self.calls_sent += sent
-        self.calls_completed += completed
-        self.errors += errors
-        for cb in self.callbacks:
-            cb({
-                'calls_sent': self.calls_sent,
-                'calls_completed': self.calls_completed,
-                'errors': self.errors
-            })
-
-async def async_batch_runner(
-    callables: List[Callable[[], Awaitable[Any]]],
-    batch_size: int = 100,
-    tracker: Optional[ProgressTracker] = None,
-    loop_fn: Optional[Callable[[List[Any]], List[Callable[[], Awaitable[Any]]]]] = None,
-    max_loops: int = 5
-) -> List[Any]:
-    results = []
-    to_run = callables
-    loops = 0
-    while to_run and (max_loops is None or loops < max_loops):
-        batch = to_run[:batch_size]
-        to_run = to_run[batch_size:]
-        if tracker:
-            tracker.update(sent=len(batch))
-        tasks = [asyncio.create_task(fn()) for fn in batch]
-        batch_results = []
-        for task in asyncio.as_completed(tasks):
-            try:
-                res = await task
-                batch_results.append(res)
-                if tracker:
-                    tracker.update(completed=1)
-            except Exception:
-                if tracker:
-                    tracker.update(errors=1)
-        results.extend(batch_results)
-        if loop_fn:
-            to_run += loop_fn(batch_results)
-        loops += 1
-    return results
-
-# Set your API key
-API_KEY = os.getenv("LLAMA_API_KEY")
-if not API_KEY:
-    raise RuntimeError("Please set your LLAMA_API_KEY environment variable.")
-
-# Initialize the Llama API client
-client = AsyncLlamaAPIClient(api_key=API_KEY)
+# Llama client, page/completion/search caches and the pooled page fetcher;
+# the token counts the API reports for each call are tallied in `usage`
+usage = UsageTracker()
+stack = SearchStack.from_env(usage)
+
+# Token budget for the page text sent in each summary prompt
+PAGE_TOKENS = 1000
 
 # Performance Metrics Tracker
 class PerformanceMetrics:
@@ -96,26 +42,34 @@ class PerformanceMetrics:
         self.total_api_cost = 0.0
         self.total_search_time = 0.0
         self.total_processing_time = 0.0
+        self.total_generation_time = 0.0
         self.web_pages_fetched = 0
         self.web_pages_failed = 0
         self.cache_hits = 0
         self.cache_misses = 0
-        self.search_history = []
-        self.request_times = []
-
-    def add_request(self, success=True, tokens_sent=0, tokens_received=0, processing_time=0.0):
+        self.search_cache_hits = 0
+        self.search_cache_misses = 0
+        # Bounded so a long session costs the same memory and refresh time as a short one
+        self.search_history = deque(maxlen=50)
+        self.request_times = QuantileSketch()
+        self.request_rate = RollingRate(window=60)
+
+    def add_request(self, success=True, processing_time=0.0):
         self.total_requests += 1
         if success:
             self.successful_requests += 1
         else:
             self.failed_requests += 1
-        self.total_tokens_sent += tokens_sent
-        self.total_tokens_received += tokens_received
         self.total_processing_time += processing_time
-        self.request_times.append(processing_time)
+        self.request_times.add(processing_time)
+        self.request_rate.add()
 
-        # Estimate cost (rough estimate for Llama API)
-        self.total_api_cost += (tokens_sent * 0.0001) + (tokens_received * 0.0002)
+    def add_usage(self, model, usage):
+        # Called for every Llama call that actually went upstream (cache hits cost nothing)
+        self.total_tokens_sent += usage['prompt_tokens']
+        self.total_tokens_received += usage['completion_tokens']
+        self.total_generation_time += usage['seconds']
+        self.total_api_cost += usage['cost']
 
     def add_search(self, query, results_count, search_time):
         self.search_history.append({
@@ -131,8 +85,26 @@ class PerformanceMetrics:
         if not success:
             self.web_pages_failed += 1
 
+    def add_cache_lookup(self, hit=True):
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def add_search_cache_lookup(self, hit=True):
+        if hit:
+            self.search_cache_hits += 1
+        else:
+            self.search_cache_misses += 1
+
     def get_average_request_time(self):
-        return sum(self.request_times) / len(self.request_times) if self.request_times else 0
+        return self.request_times.mean()
+
+    def get_request_percentiles(self):
+        return {q: self.request_times.quantile(q / 100) for q in (50, 95, 99)}
+
+    def get_requests_per_minute(self):
+        return self.request_rate.rate() * 60
 
     def get_success_rate(self):
         return (self.successful_requests / self.total_requests * 100) if self.total_requests > 0 else 0
@@ -159,6 +131,10 @@ class PerformanceMetrics:
 
 # Global metrics instance
 metrics = PerformanceMetrics()
+usage.register_callback(metrics.add_usage)
+
+stack.page_cache.register_callback(metrics.add_cache_lookup)
+stack.search_cache.register_callback(metrics.add_search_cache_lookup)
 
 class WebSearchGUI:
     def __init__(self, root):
@@ -195,8 +171,12 @@ class WebSearchGUI:
 
         # Current search results and navigation
         self.current_results = []
+        self.summary_labels = {}  # Result index -> summary label, for streamed updates
         self.result_history = []  # Stack for back navigation
         self.current_query = ""
+        # Every search gets an id so streamed summaries only land on its own page
+        self.search_generation = 0  # Last id handed out (CLI thread)
+        self.displayed_search = None  # Id of the search on screen (GUI thread)
 
         # Research organization (Goose) - Define categories first
         self.goose_categories = ["General", "Important", "Follow-up", "Archive"]
@@ -391,6 +371,7 @@ class WebSearchGUI:
         """Update the metrics display"""
         try:
             # API Metrics
+            percentiles = metrics.get_request_percentiles()
             api_text = f"""🔥 API METRICS
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📊 Total Requests: {metrics.total_requests}
@@ -402,11 +383,12 @@ class WebSearchGUI:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📤 Tokens Sent: {metrics.total_tokens_sent:,}
 📥 Tokens Received: {metrics.total_tokens_received:,}
-💰 Estimated Cost: ${metrics.total_api_cost:.4f}
+💰 Cost: ${metrics.total_api_cost:.4f}
 
 ⏱️ TIMING
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 ⚡ Avg Request Time: {metrics.get_average_request_time():.2f}s
+📐 p50 / p95 / p99: {percentiles[50]:.2f}s / {percentiles[95]:.2f}s / {percentiles[99]:.2f}s
 🔍 Total Search Time: {metrics.total_search_time:.2f}s
 🤖 Total Processing: {metrics.total_processing_time:.2f}s
 
@@ -431,13 +413,14 @@ class WebSearchGUI:
 ⏰ SESSION INFO
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 🕐 Uptime: {uptime/60:.1f} minutes
-🔄 Requests/Min: {(metrics.total_requests / max(uptime/60, 1)):.1f}
+🔄 Requests/Min (last 60s): {metrics.get_requests_per_minute():.1f}
 ⚡ Avg Load: {(metrics.total_processing_time / max(uptime, 1) * 100):.1f}%
 
 🎯 EFFICIENCY
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 💎 Cache Hit Rate: {((metrics.cache_hits / max(metrics.cache_hits + metrics.cache_misses, 1)) * 100):.1f}%
-🚀 Tokens/Second: {(metrics.total_tokens_received / max(metrics.total_processing_time, 1)):.1f}
+🔎 Search Cache Hit Rate: {((metrics.search_cache_hits / max(metrics.search_cache_hits + metrics.search_cache_misses, 1)) * 100):.1f}%
+🚀 Tokens/Second: {(metrics.total_tokens_received / max(metrics.total_generation_time, 1e-9)):.1f}
 💸 Cost/Request: ${(metrics.total_api_cost / max(metrics.total_requests, 1)):.4f}"""
 
             self.system_metrics_text.delete(1.0, tk.END)
@@ -445,7 +428,7 @@ class WebSearchGUI:
 
             # Search History
             history_text = "🔍 SEARCH HISTORY\n" + "━" * 40 + "\n"
-            for i, search in enumerate(metrics.search_history[-10:], 1):  # Show last 10 searches
+            for i, search in enumerate(list(metrics.search_history)[-10:], 1):  # Show last 10 searches
                 timestamp = datetime.fromisoformat(search['timestamp']).strftime('%H:%M:%S')
                 history_text += f"{i:2d}. [{timestamp}] {search['query'][:30]}{'...' if len(search['query']) > 30 else ''}\n"
                 history_text += f"     📊 {search['results_count']} results in {search['search_time']:.2f}s\n\n"
@@ -546,7 +529,7 @@ class WebSearchGUI:
             previous_state = self.result_history.pop()
             self.current_results = previous_state['results']
             self.current_query = previous_state['query']
-            self.display_results(self.current_results)
+            self.display_results(self.current_results, previous_state.get('search_id'))
             self.cli_print(f"⬅️ Back to: {self.current_query}")
         else:
             self.cli_print("⬅️ No previous results to go back to!")
@@ -557,6 +540,7 @@ class WebSearchGUI:
             state = {
                 'results': self.current_results.copy(),
                 'query': self.current_query,
+                'search_id': self.displayed_search,
                 'timestamp': datetime.now().isoformat()
             }
             self.result_history.append(state)
@@ -633,13 +617,15 @@ class WebSearchGUI:
             progress_value = (current / total) * 100
             self.progress['value'] = progress_value
 
-    def display_results(self, results):
+    def display_results(self, results, search_id=None):
         """Display search results in GUI pane"""
         # Clear previous results
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
 
         self.current_results = results
+        self.displayed_search = search_id
+        self.summary_labels = {}
 
         # Update back button state
         self.back_btn.config(state=tk.NORMAL if self.result_history else tk.DISABLED)
@@ -664,6 +650,21 @@ class WebSearchGUI:
         # Update Goose display
         self.update_goose_display()
 
+    def update_result(self, search_id, index, result):
+        """Fill in a streamed summary on an existing result card"""
+        # Late summaries from a search that is no longer on screen are dropped
+        if search_id == self.displayed_search and 0 < index <= len(self.current_results):
+            self.current_results[index - 1] = result
+            label = self.summary_labels.get(index)
+            if label is not None:
+                label.config(text=result.get('summary', 'No summary available'))
+
+    def finish_results(self, search_id, results):
+        """Replace placeholders saved in history while a search was still streaming"""
+        for state in self.result_history:
+            if state.get('search_id') == search_id:
+                state['results'] = list(results)
+
     def create_result_card(self, index, result):
         """Create a card for each search result"""
         # Main card frame
@@ -719,6 +720,7 @@ class WebSearchGUI:
             justify=tk.LEFT
         )
         summary_label.pack(anchor=tk.W)
+        self.summary_labels[index] = summary_label
 
         # Actions frame
         actions_frame = ttk.Frame(card_frame)
@@ -751,7 +753,7 @@ class WebSearchGUI:
         goose_btn = ttk.Button(
             goose_frame,
             text="🪿 Add to Goose",
-            command=lambda r=result, var=category_var: self.add_to_goose(r, var.get())
+            command=lambda idx=index, var=category_var: self.add_to_goose(self.current_results[idx - 1], var.get())
         )
         goose_btn.pack(side=tk.LEFT, padx=(2, 0))
 
@@ -792,7 +794,14 @@ class WebSearchGUI:
                 message_type, data = self.results_queue.get_nowait()
 
                 if message_type == 'results':
-                    self.display_results(data)
+                    search_id, results = data
+                    self.display_results(results, search_id)
+                elif message_type == 'result_update':
+                    search_id, index, result = data
+                    self.update_result(search_id, index, result)
+                elif message_type == 'results_done':
+                    search_id, results = data
+                    self.finish_results(search_id, results)
                 elif message_type == 'status':
                     self.update_status(data)
                 elif message_type == 'progress':
@@ -841,6 +850,8 @@ class WebSearchGUI:
             return
 
         search_start_time = time.time()
+        self.search_generation += 1
+        search_id = self.search_generation
 
         # Update current query
         self.current_query = query
@@ -870,8 +881,18 @@ class WebSearchGUI:
             tracker = ProgressTracker()
             tracker.register_callback(self.progress_callback)
 
+            # Show the raw hits right away; each card fills in as its summary lands
+            placeholders = [
+                {"title": w.get('title') or '', "url": w.get('href') or w.get('url'), "summary": "⏳ Summarizing..."}
+                for w in web_results
+            ]
+            self.results_queue.put(('results', (search_id, placeholders)))
+
             # Create callables for parallel processing
-            callables = [lambda r=r: self.llama_summarize_web_result(r) for r in web_results]
+            callables = [
+                lambda i=i, r=r: self.summarize_and_publish(search_id, i, r)
+                for i, r in enumerate(web_results, 1)
+            ]
 
             # Process results
             results = await async_batch_runner(
@@ -881,13 +902,20 @@ class WebSearchGUI:
                 loop_fn=None,
                 max_loops=1
             )
+            # Failures keep their slot so the cards stay in search rank order
+            for index, (w, r) in enumerate(zip(web_results, results), 1):
+                if isinstance(r, Exception):
+                    results[index - 1] = {
+                        "title": w.get('title') or '', "url": w.get('href') or w.get('url'),
+                        "summary": f"Error summarizing: {r}"
+                    }
+                    self.results_queue.put(('result_update', (search_id, index, results[index - 1])))
+            self.results_queue.put(('results_done', (search_id, results)))
 
             # Record search metrics
             search_time = time.time() - search_start_time
             metrics.add_search(query, len(results), search_time)
 
-            # Display results
-            self.results_queue.put(('results', results))
             self.results_queue.put(('cli_print', f"✅ Found {len(results)} results in {search_time:.2f}s!"))
             self.results_queue.put(('status', f"Found {len(results)} results"))
 
@@ -917,12 +945,17 @@ class WebSearchGUI:
     def duckduckgo_web_search(self, query: str, max_results: int = 10):
         """Search DuckDuckGo"""
         try:
-            ddgs = DDGS()
-            return list(ddgs.text(query, max_results=max_results))
+            return stack.web_search(query, max_results)
         except Exception as e:
             self.results_queue.put(('cli_print', f"❌ Search error: {str(e)}"))
             return []
 
+    async def summarize_and_publish(self, search_id, index, result: dict):
+        """Summarize one result and push it to its card as soon as it is ready"""
+        summary = await self.llama_summarize_web_result(result)
+        self.results_queue.put(('result_update', (search_id, index, summary)))
+        return summary
+
     async def llama_summarize_web_result(self, result: dict):
         """Summarize web result using Llama"""
         start_time = time.time()
@@ -934,20 +967,10 @@ class WebSearchGUI:
         # Try to fetch full page content
         page_text = None
         if url:
-            try:
-                resp = requests.get(url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-                if resp.ok and 'text/html' in resp.headers.get('Content-Type', ''):
-                    doc = Document(resp.text)
-                    page_text = doc.summary(html_partial=False)
-                    # Remove HTML tags
-                    import re
-                    page_text = re.sub('<[^<]+?>', '', page_text)
-                    page_text = page_text[:4000]  # Truncate
-                    metrics.add_web_fetch(True)
-                else:
-                    metrics.add_web_fetch(False)
-            except Exception:
-                metrics.add_web_fetch(False)
+            page_text = await stack.fetcher.fetch_text(url, timeout=10)
+            metrics.add_web_fetch(page_text is not None)
+            if page_text:
+                page_text = truncate_tokens(page_text, PAGE_TOKENS)
 
         # Create prompt
         if page_text:
@@ -955,11 +978,9 @@ class WebSearchGUI:
         else:
             prompt = f"Summarize this search result concisely.\n\nTitle: {title}\nSnippet: {snippet}\nURL: {url}"
 
-        # Estimate tokens (rough approximation)
-        tokens_sent = len(prompt.split()) * 1.3  # Rough token estimate
-
         try:
-            response = await client.chat.completions.create(
+            response = await stack.completion_cache.async_create(
+                stack.client,
                 model="Llama-3.3-70B-Instruct",
                 messages=[{"role": "user", "content": prompt}],
                 max_completion_tokens=300,
@@ -967,16 +988,10 @@ class WebSearchGUI:
             )
 
             summary = response.completion_message.content.text
-            tokens_received = len(summary.split()) * 1.3
             processing_time = time.time() - start_time
 
-            # Record metrics
-            metrics.add_request(
-                success=True,
-                tokens_sent=int(tokens_sent),
-                tokens_received=int(tokens_received),
-                processing_time=processing_time
-            )
+            # Record metrics (token counts arrive through the usage tracker)
+            metrics.add_request(success=True, processing_time=processing_time)
 
             return {
                 "title": title,
@@ -985,12 +1000,7 @@ class WebSearchGUI:
             }
         except Exception as e:
             processing_time = time.time() - start_time
-            metrics.add_request(
-                success=False,
-                tokens_sent=int(tokens_sent),
-                tokens_received=0,
-                processing_time=processing_time
-            )
+            metrics.add_request(success=False, processing_time=processing_time)
 
             return {
                 "title": title,
@@ -1,13 +1,13 @@
-import requests
-from readability import Document
-from ddgs import DDGS
 import asyncio
 import os
-from typing import Any, Awaitable, Callable, List, Optional, Dict
-import re
+import sys
 
-# Import the llama client
-from llama_api_client import AsyncLlamaAPIClient
+# Make the shared integrata_* helpers importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from integrata_concurrency import ProgressTracker, async_batch_runner
+from integrata_search import SearchStack
+from integrata_tokens import truncate_tokens
+from integrata_trace import Trace, activate, span
 
 # ANSI color codes for better output
 class Colors:
@@ -21,74 +21,21 @@ class Colors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-# Copy the concurrent utilities directly here
-class ProgressTracker:
-    def __init__(self):
-        self.calls_sent = 0
-        self.calls_completed = 0
-        self.errors = 0
-        self.callbacks = []
-
-    def register_callback(self, callback: Callable[[Dict[str, int]], None]):
-        self.callbacks.append(callback)
-
-    def update(self, sent=0, completed=0, errors=0):
-        self.calls_sent += sent
-        self.calls_completed += completed
-        self.errors += errors
-        for cb in self.callbacks:
-            cb({
-                'calls_sent': self.calls_sent,
-                'calls_completed': self.calls_completed,
-                'errors': self.errors
-            })
-
-async def async_batch_runner(
-    callables: List[Callable[[], Awaitable[Any]]],
-    batch_size: int = 100,
-    tracker: Optional[ProgressTracker] = None,
-    loop_fn: Optional[Callable[[List[Any]], List[Callable[[], Awaitable[Any]]]]] = None,
-    max_loops: int = 5
-) -> List[Any]:
-    results = []
-    to_run = callables
-    loops = 0
-    while to_run and (max_loops is None or loops < max_loops):
-        batch = to_run[:batch_size]
-        to_run = to_run[batch_size:]
-        if tracker:
-            tracker.update(sent=len(batch))
-        tasks = [asyncio.create_task(fn()) for fn in batch]
-        batch_results = []
-        for task in asyncio.as_completed(tasks):
-            try:
-                res = await task
-                batch_results.append(res)
-                if tracker:
-                    tracker.update(completed=1)
-            except Exception:
-                if tracker:
-                    tracker.update(errors=1)
-        results.extend(batch_results)
-        if loop_fn:
-            to_run += loop_fn(batch_results)
-        loops += 1
-    return results
-
-# Set your API key as an environment variable or directly here
-API_KEY = os.getenv("LLAMA_API_KEY")
-if not API_KEY or API_KEY == "YOUR_API_KEY_HERE":
-    raise RuntimeError("Please set your LLAMA_API_KEY environment variable with your Llama API key.")
+# Llama client, page/completion/search caches and the pooled page fetcher;
+# reads the API key from LLAMA_API_KEY
+stack = SearchStack.from_env()
 
+# Token budget for the page text sent in each summary prompt
+PAGE_TOKENS = 1500
 
-# Initialize the Llama API client
-client = AsyncLlamaAPIClient(api_key=API_KEY)
+# When set, each batch of summaries is traced (fetch, extract, Llama call per
+# result) and appended to this file as OTLP/JSON lines
+TRACE_FILE = os.getenv("INTEGRATA_TRACE_FILE")
 
 
 # Fetch real web results using DuckDuckGo
 def duckduckgo_web_search(query: str, max_results: int = 10):
-    ddgs = DDGS()
-    return list(ddgs.text(query, max_results=max_results))
+    return stack.web_search(query, max_results)
 
 
 # Fetch and summarize the actual web page content
@@ -96,31 +43,25 @@ async def llama_summarize_web_result(result: dict):
     url = result.get('href') or result.get('url')
     snippet = result.get('body') or result.get('snippet') or ''
     title = result.get('title') or ''
-    page_text = None
-    if url:
-        try:
-            resp = requests.get(url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-            if resp.ok and 'text/html' in resp.headers.get('Content-Type', ''):
-                doc = Document(resp.text)
-                page_text = doc.summary(html_partial=False)
-                # Remove HTML tags
-                import re
-                page_text = re.sub('<[^<]+?>', '', page_text)
-                # Truncate to avoid token overflow
-                page_text = page_text[:6000]
-        except Exception:
-            page_text = None
-    if page_text:
-        prompt = f"Summarize the following web page for a user deciding what to click next. Title: {title}\nURL: {url}\nContent: {page_text}"
-    else:
-        prompt = f"Summarize this web result for a user deciding what to click next. Title: {title}\nSnippet: {snippet}\nURL: {url}"
-
-    response = await client.chat.completions.create(
-        model="Llama-3.3-70B-Instruct",
-        messages=[{"role": "user", "content": prompt}],
-        max_completion_tokens=512,
-        temperature=0.7,
-    )
+    with span("result", url=url or ""):
+        page_text = None
+        if url:
+            page_text = await stack.fetcher.fetch_text(url, timeout=10)
+            if page_text:
+                # Keep the leading paragraphs that fit the prompt budget
+                page_text = truncate_tokens(page_text, PAGE_TOKENS)
+        if page_text:
+            prompt = f"Summarize the following web page for a user deciding what to click next. Title: {title}\nURL: {url}\nContent: {page_text}"
+        else:
+            prompt = f"Summarize this web result for a user deciding what to click next. Title: {title}\nSnippet: {snippet}\nURL: {url}"
+
+        response = await stack.completion_cache.async_create(
+            stack.client,
+            model="Llama-3.3-70B-Instruct",
+            messages=[{"role": "user", "content": prompt}],
+            max_completion_tokens=512,
+            temperature=0.7,
+        )
 
     return {
         "title": title,
@@ -129,6 +70,32 @@ async def llama_summarize_web_result(result: dict):
     }
 
 
+def failed_result(result: dict, error: Exception):
+    """Stand-in for a result whose summary raised, so result numbering stays aligned."""
+    return {
+        "title": result.get('title') or '',
+        "url": result.get('href') or result.get('url'),
+        "summary": f"Error summarizing: {error}"
+    }
+
+
+async def summarize_all(web_results, tracker):
+    """Summarize every hit with up to 8 in flight, keeping them in rank order."""
+    trace = Trace("parallel_web_search", include_in_results=False) if TRACE_FILE else None
+    with activate(trace):
+        callables = [lambda r=r: llama_summarize_web_result(r) for r in web_results]
+        results = await async_batch_runner(
+            callables,
+            batch_size=8,
+            tracker=tracker,
+            loop_fn=None,
+            max_loops=1
+        )
+    if trace is not None:
+        trace.export(TRACE_FILE)
+    return [failed_result(w, r) if isinstance(r, Exception) else r for w, r in zip(web_results, results)]
+
+
 def summarize_results(results):
     """Format results in a more readable way with better visual separation"""
     formatted_results = []
@@ -203,14 +170,7 @@ async def interactive_search():
                 continue
 
             print(f"{Colors.OKGREEN}✅ Found {len(web_results)} results! Summarizing with Llama AI...{Colors.ENDC}")
-            callables = [lambda r=r: llama_summarize_web_result(r) for r in web_results]
-            results = await async_batch_runner(
-                callables,
-                batch_size=8,
-                tracker=tracker,
-                loop_fn=None,
-                max_loops=1
-            )
+            results = await summarize_all(web_results, tracker)
 
             print(f"\n{Colors.OKGREEN}✅ Processing complete!{Colors.ENDC}")
             print_header("📊 SEARCH RESULTS")
@@ -235,14 +195,7 @@ async def interactive_search():
                     web_results = duckduckgo_web_search(next_query, max_results=8)
                     if web_results:
                         print(f"\n{Colors.OKGREEN}✅ Found {len(web_results)} related results! Summarizing...{Colors.ENDC}")
-                        callables = [lambda r=r: llama_summarize_web_result(r) for r in web_results]
-                        results = await async_batch_runner(
-                            callables,
-                            batch_size=8,
-                            tracker=tracker,
-                            loop_fn=None,
-                            max_loops=1
-                        )
+                        results = await summarize_all(web_results, tracker)
 
                         print(f"\n{Colors.OKGREEN}✅ Processing complete!{Colors.ENDC}")
                         print_header("📊 DRILL-DOWN RESULTS")
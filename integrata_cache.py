@@ -0,0 +1,470 @@
+"""
+Persistent caches used by IntegrataLlama and the web search scripts.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from integrata_concurrency import SingleFlight
+from integrata_metrics import OutcomeCounter
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "INTEGRATA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "integrata_llama"),
+)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+_WORD = re.compile(r"\w+")
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonicalize a URL for use as a cache key.
+
+    Lowercases scheme and host, drops default ports, fragments and common
+    tracking parameters, and sorts the remaining query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def normalize_query(query: str) -> str:
+    """Canonicalize a search query: case-folded with whitespace collapsed."""
+    return " ".join(query.casefold().split())
+
+
+def _open_db(path: str, table: str, schema: str) -> sqlite3.Connection:
+    """Open an SQLite cache file with its table and an index for LRU eviction."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    # WAL keeps commits cheap and lets readers in other processes run during writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({schema})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+    conn.commit()
+    return conn
+
+
+def _total_size(conn: sqlite3.Connection, table: str) -> int:
+    (total,) = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()
+    return total
+
+
+def _row_size(conn: sqlite3.Connection, table: str, key: str) -> int:
+    row = conn.execute(f"SELECT size FROM {table} WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def _evict_lru(conn: sqlite3.Connection, table: str, total: int, max_bytes: int) -> int:
+    """
+    Delete least-recently-accessed rows of ``table`` until ``total`` (the
+    running size of the table) fits ``max_bytes``; return the new total.
+    """
+    while total > max_bytes:
+        rows = conn.execute(f"SELECT key, size FROM {table} ORDER BY last_access ASC LIMIT 64").fetchall()
+        if not rows:
+            return 0
+        for key, size in rows:
+            if total <= max_bytes:
+                break
+            conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            total -= size
+    return total
+
+
+def _flush_touches(conn: sqlite3.Connection, table: str, touched: Dict[str, float]):
+    """Write the access times recorded by reads, which are batched rather than committed one by one."""
+    if touched:
+        conn.executemany(f"UPDATE {table} SET last_access = ? WHERE key = ?",
+                         [(at, key) for key, at in touched.items()])
+        touched.clear()
+
+
+# Reads record access times in memory and write them once this many are pending
+_TOUCH_BATCH = 256
+# Bytes charged per page row on top of its text (key, validators, row
+# overhead), so rows without text still count towards max_bytes
+_PAGE_ROW_BYTES = 256
+
+
+class PageCache(OutcomeCounter):
+    """
+    On-disk cache of extracted page text keyed by normalized URL.
+
+    Entries keep the ETag/Last-Modified validators of the response they came
+    from. Entries younger than ``ttl`` seconds are served without touching the
+    network; older ones are revalidated with a conditional GET. The total size
+    of stored entries (text plus a fixed per-row charge) is capped at
+    ``max_bytes`` with least-recently-used eviction.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 24 * 3600, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__()
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, "pages.sqlite3")
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = _open_db(
+            path, "pages",
+            "key TEXT PRIMARY KEY, text TEXT, etag TEXT, last_modified TEXT,"
+            " fetched_at REAL, last_access REAL, size INTEGER",
+        )
+        self._size = _total_size(self._conn, "pages")
+        self._touched: Dict[str, float] = {}
+
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        Return the cached entry for ``url`` or None.
+
+        The entry has ``text``, ``etag``, ``last_modified`` and ``fresh`` (False
+        once the TTL has expired and the entry needs revalidation).
+        """
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, etag, last_modified, fetched_at FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= _TOUCH_BATCH:
+                _flush_touches(self._conn, "pages", self._touched)
+                self._conn.commit()
+        text, etag, last_modified, fetched_at = row
+        return {
+            "text": text,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": now - fetched_at < self.ttl,
+        }
+
+    def put(self, url: str, text: Optional[str], etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Store extracted ``text`` (None for non-HTML pages) and its validators."""
+        key = normalize_url(url)
+        now = time.time()
+        size = _PAGE_ROW_BYTES + (len(text.encode("utf-8")) if text else 0)
+        with self._lock:
+            _flush_touches(self._conn, "pages", self._touched)
+            self._size -= _row_size(self._conn, "pages", key)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, text, etag, last_modified, now, now, size),
+            )
+            self._size = _evict_lru(self._conn, "pages", self._size + size, self.max_bytes)
+            self._conn.commit()
+
+    def touch(self, url: str):
+        """Mark an entry as revalidated (e.g. after a 304), restarting its TTL."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, last_access = ? WHERE key = ?",
+                (now, now, normalize_url(url)),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+            self._size = 0
+            self._touched.clear()
+
+
+# Request options that do not change what the model generates
+_UNKEYED_PARAMS = ("timeout", "extra_headers", "extra_query", "stream")
+
+
+class CompletionCache(OutcomeCounter):
+    """
+    Memoizes chat completions keyed by model, a hash of the messages and the
+    sampling parameters.
+
+    Lookups go through a small in-memory LRU first and an SQLite tier second,
+    so identical prompts are answered without an upstream call across queries
+    and restarts. Entries expire after ``ttl`` seconds; the memory tier holds at
+    most ``max_entries`` responses and the disk tier at most ``max_bytes``.
+    Streaming requests are never cached.
+    """
+
+    table = "completions"
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 24 * 3600,
+                 max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__()
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, f"{self.table}.sqlite3")
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = _open_db(
+            path, self.table, "key TEXT PRIMARY KEY, value TEXT, created_at REAL, last_access REAL, size INTEGER"
+        )
+        self._size = _total_size(self._conn, self.table)
+        self._touched: Dict[str, float] = {}
+
+    @staticmethod
+    def key(**params) -> str:
+        """Hash the model, messages and sampling parameters of a create() call."""
+        keyed = {k: v for k, v in params.items() if k not in _UNKEYED_PARAMS}
+        blob = json.dumps(keyed, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            created_at, value = item
+            if now - created_at < self.ttl:
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key]
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                return None  # expired rows are replaced by the next put or evicted
+            self._touched[key] = now
+            if len(self._touched) >= _TOUCH_BATCH:
+                _flush_touches(self._conn, self.table, self._touched)
+                self._conn.commit()
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            return value
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        value = self._get_memory(key, now)
+        return value if value is not None else self._get_disk(key, now)
+
+    async def async_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """get() that reads the disk tier on a worker thread."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        return value if value is not None else await asyncio.to_thread(self._get_disk, key, now)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        blob = json.dumps(value)
+        with self._lock:
+            self._remember(key, now, value)
+            _flush_touches(self._conn, self.table, self._touched)
+            self._size -= _row_size(self._conn, self.table, key)
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                (key, blob, now, now, len(blob)),
+            )
+            self._size = _evict_lru(self._conn, self.table, self._size + len(blob), self.max_bytes)
+            self._conn.commit()
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    @staticmethod
+    def _endpoint(client):
+        return client.chat.completions
+
+    @staticmethod
+    def _response_type():
+        from llama_api_client.types import CreateChatCompletionResponse
+        return CreateChatCompletionResponse
+
+    def create(self, client, use_cache: bool = True, **params):
+        """
+        Memoized ``client.chat.completions.create(**params)``.
+
+        Pass ``use_cache=False`` to always go upstream (the fresh response still
+        refreshes the cache).
+        """
+        if params.get("stream"):
+            return self._endpoint(client).create(**params)
+        key = self.key(**params)
+        if use_cache:
+            cached = self.get(key)
+            self.record(cached is not None)
+            if cached is not None:
+                return self._response_type().model_validate(cached)
+        response = self._endpoint(client).create(**params)
+        self.put(key, response.model_dump(mode="json"))
+        return response
+
+    async def async_create(self, async_client, use_cache: bool = True, **params):
+        """Async version of create() for an AsyncLlamaAPIClient."""
+        if params.get("stream"):
+            return await self._endpoint(async_client).create(**params)
+        key = self.key(**params)
+        if use_cache:
+            cached = await self.async_get(key)
+            self.record(cached is not None)
+            if cached is not None:
+                return self._response_type().model_validate(cached)
+        response = await self._endpoint(async_client).create(**params)
+        await asyncio.to_thread(self.put, key, response.model_dump(mode="json"))
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+            self._size = 0
+            self._touched.clear()
+
+
+class ModerationCache(CompletionCache):
+    """
+    Memoizes moderation results keyed by a hash of the model and the
+    moderated messages, so content that was already checked is not sent
+    again. Same tiers, expiry and limits as CompletionCache.
+    """
+
+    table = "moderations"
+
+    @staticmethod
+    def _endpoint(client):
+        return client.moderations
+
+    @staticmethod
+    def _response_type():
+        from llama_api_client.types import ModerationCreateResponse
+        return ModerationCreateResponse
+
+
+class SearchCache(OutcomeCounter):
+    """
+    In-memory cache of search engine results keyed by normalized query and
+    ``max_results``.
+
+    Entries live for ``ttl`` seconds and at most ``max_entries`` are kept,
+    evicting the least recently used. Concurrent lookups of the same uncached
+    query share one search call. Empty result lists are not cached.
+    """
+
+    def __init__(self, ttl: float = 15 * 60, max_entries: int = 512):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get_or_search(self, query: str, max_results: int, search_fn: Callable[[str, int], List[Dict]]) -> List[Dict]:
+        """
+        Return cached results for ``query`` or call ``search_fn(query, max_results)``.
+
+        A caller that joins an in-flight search for the same key counts as a hit.
+        """
+        key = (normalize_query(query), max_results)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry is not None and now - entry[0] < self.ttl
+            if fresh:
+                self._entries.move_to_end(key)
+        if fresh:
+            self.record(True)
+            return list(entry[1])
+        searched = []
+
+        def search():
+            searched.append(True)
+            self.record(False)
+            results = list(search_fn(query, max_results))
+            if results:
+                with self._lock:
+                    self._entries[key] = (time.time(), results)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return results
+
+        results = self._flight.do(key, search)
+        if not searched:
+            self.record(True)
+        return list(results)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def normalize_text(text: str) -> str:
+    """Canonicalize free text: case-folded words in order, without punctuation."""
+    return " ".join(_WORD.findall(text.casefold()))
+
+
+class IntentCache(OutcomeCounter):
+    """
+    In-memory cache of intent classifications keyed by normalized input text.
+
+    Case, punctuation and spacing are ignored but every word and its position
+    count: one changed or moved word ("news" for "weather", "do not moderate")
+    can change what a request asks for. Entries live for ``ttl`` seconds and
+    at most ``max_entries`` are kept, evicting the least recently used.
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, max_entries: int = 2048):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> Optional[Any]:
+        key = normalize_text(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self.record(entry is not None)
+        return entry[1] if entry is not None else None
+
+    def set(self, text: str, value: Any):
+        key = normalize_text(text)
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,236 @@
+"""
+Concurrency helpers shared by IntegrataLlama and the web search scripts.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class ProgressTracker:
+    def __init__(self):
+        self.calls_sent = 0
+        self.calls_completed = 0
+        self.errors = 0
+        self.callbacks = []
+
+    def register_callback(self, callback: Callable[[Dict[str, int]], None]):
+        self.callbacks.append(callback)
+
+    def update(self, sent=0, completed=0, errors=0):
+        self.calls_sent += sent
+        self.calls_completed += completed
+        self.errors += errors
+        for cb in self.callbacks:
+            cb({
+                'calls_sent': self.calls_sent,
+                'calls_completed': self.calls_completed,
+                'errors': self.errors
+            })
+
+
+async def async_batch_runner(
+    callables: List[Callable[[], Awaitable[Any]]],
+    batch_size: int = 100,
+    tracker: Optional[ProgressTracker] = None,
+    loop_fn: Optional[Callable[[List[Any]], List[Callable[[], Awaitable[Any]]]]] = None,
+    max_loops: Optional[int] = 5
+) -> List[Any]:
+    """
+    Run ``callables`` keeping up to ``batch_size`` of them in flight.
+
+    This is a sliding window rather than a sequence of batches: as soon as one
+    call finishes the next one starts, so a single slow call never holds up
+    the rest. Results come back in submission order, and a call that raised
+    leaves its exception in its slot instead of being dropped.
+
+    ``loop_fn`` is called with ``[result]`` for each successful call and may
+    return follow-up callables, which are queued immediately and appended to
+    the results. ``max_loops`` bounds how many generations of follow-ups run
+    (1 means no follow-ups; None means unbounded). ``tracker`` is told about
+    every queued call and every completion or error.
+    """
+    results: List[Any] = []
+    pending = deque()
+
+    def enqueue(fns, depth):
+        for fn in fns:
+            pending.append((len(results), depth, fn))
+            results.append(None)
+        if tracker and fns:
+            tracker.update(sent=len(fns))
+
+    async def run_one(index, depth, fn):
+        try:
+            res = await fn()
+        except Exception as e:
+            results[index] = e
+            if tracker:
+                tracker.update(errors=1)
+            return
+        results[index] = res
+        if tracker:
+            tracker.update(completed=1)
+        if loop_fn and (max_loops is None or depth + 1 < max_loops):
+            enqueue(list(loop_fn([res])), depth + 1)
+
+    enqueue(list(callables), 0)
+    running = set()
+    try:
+        while pending or running:
+            while pending and len(running) < max(1, batch_size):
+                running.add(asyncio.create_task(run_one(*pending.popleft())))
+            _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in running:
+            task.cancel()
+    return results
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs ``fn``; callers that arrive while it is
+    still running block and receive the same result (or exception). Nothing
+    is remembered once the call finishes. ``coalesced`` counts the callers
+    that were served by someone else's call.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """
+    Async version of SingleFlight for coroutines on an event loop.
+
+    The first caller's coroutine runs as its own task and every caller awaits
+    it through ``asyncio.shield``, so one caller being cancelled does not
+    cancel the call for the others; once every caller has been cancelled the
+    task is cancelled too. Calls are only shared within one loop.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        # (loop, key) -> [task, number of callers awaiting it]
+        self._calls: Dict[Hashable, list] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        flight = (loop, key)
+        call = self._calls.get(flight)
+        if call is None:
+            call = self._calls[flight] = [loop.create_task(fn(*args, **kwargs)), 0]
+
+            def forget(_, call=call):
+                if self._calls.get(flight) is call:
+                    del self._calls[flight]
+            call[0].add_done_callback(forget)
+        else:
+            self.coalesced += 1
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                # Nobody is waiting any more: stop the upstream call
+                call[0].cancel()
+                if self._calls.get(flight) is call:
+                    del self._calls[flight]
+
+
+def _wake_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Slots:
+    """
+    Counting semaphore shared by threads and event loops.
+
+    acquire() blocks the calling thread; async_acquire() suspends the
+    coroutine without blocking its loop. Waiting coroutines are queued in
+    arrival order and woken by release() when a slot frees up, rather than
+    polling. ``limit`` may be changed while the semaphore is in use.
+    """
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._waiters: "deque[tuple]" = deque()
+
+    def _free(self) -> int:
+        return int(self.limit) - self.in_flight
+
+    def _wake(self):
+        """Wake as many queued coroutines as there are free slots; call with the lock held."""
+        self._cond.notify_all()
+        for _ in range(min(self._free(), len(self._waiters))):
+            loop, waiter = self._waiters.popleft()
+            loop.call_soon_threadsafe(_wake_waiter, waiter)
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._free() > 0:
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self._free() <= 0:
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def async_acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._free() > 0:
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    try:
+                        self._waiters.remove((loop, waiter))
+                    except ValueError:
+                        self._wake()  # already woken: pass the wakeup on
+                raise
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._wake()
@@ -0,0 +1,111 @@
+"""
+HTML text extraction, optionally run on a pool of worker processes.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import lxml.html
+from lxml.etree import ParserError
+from readability import Document
+
+from integrata_concurrency import Slots
+
+# Elements whose boundaries should become line breaks in the extracted text
+_BLOCK_TAGS = (
+    "p", "div", "br", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+    "tr", "table", "section", "article", "blockquote", "pre", "header", "footer",
+)
+_DROP_TAGS = ("script", "style", "noscript", "template")
+
+
+def html_to_text(html: str) -> str:
+    """
+    Convert an HTML fragment to plain text.
+
+    Unlike stripping tags with a regex, this decodes entities, drops script and
+    style bodies, and keeps block boundaries as line breaks.
+    """
+    try:
+        root = lxml.html.fromstring(html)
+    except (ParserError, ValueError):
+        return ""
+    for el in list(root.iter(*_DROP_TAGS)):
+        el.drop_tree()
+    for el in root.iter(*_BLOCK_TAGS):
+        el.tail = "\n" + (el.tail or "")
+    text = root.text_content()
+    text = re.sub(r"[ \t\r\f\v\xa0]+", " ", text)
+    text = re.sub(r" *\n[ \n]*", "\n", text)
+    return text.strip()
+
+
+def extract_text(html: str) -> str:
+    """Extract the readable article text from an HTML document."""
+    doc = Document(html)
+    return html_to_text(doc.summary(html_partial=True))
+
+
+class ExtractionPool:
+    """
+    Runs extract_text() on a ProcessPoolExecutor so readability/lxml work is
+    spread over ``workers`` cores instead of pinning the calling thread.
+
+    At most ``max_pending`` documents are queued or running at once, counted
+    across threads and event loops together; further submissions wait for a
+    slot (blocking for extract(), awaiting for async_extract()), so a burst of
+    fetched pages cannot pile up unbounded HTML in memory. The process pool is
+    started on first use with the "forkserver" start method ("spawn" where
+    that is unavailable): forking the server process would copy its threads'
+    locks and its open connections into every worker.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slots = Slots(self.max_pending)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+                )
+            return self._executor
+
+    def submit(self, html: str) -> Future:
+        """Queue ``html`` for extraction, blocking while the queue is full."""
+        self._slots.acquire()
+        return self._submit(html)
+
+    def _submit(self, html: str) -> Future:
+        """Submit with a slot already held; the slot is released when the future is done."""
+        try:
+            future = self._get_executor().submit(extract_text, html)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def extract(self, html: str) -> str:
+        return self.submit(html).result()
+
+    async def async_extract(self, html: str) -> str:
+        """Extract on the process pool without blocking the event loop."""
+        await self._slots.async_acquire()
+        return await asyncio.wrap_future(self._submit(html))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,310 @@
+"""
+Page fetching shared by the web search implementations.
+"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from integrata_cache import PageCache
+from integrata_extract import ExtractionPool, extract_text
+from integrata_metrics import OutcomeCounter
+from integrata_trace import span
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+def _response_encoding(content_type: str) -> str:
+    """Charset declared in a Content-Type header, defaulting to UTF-8."""
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset" and value:
+            return value.strip('"\'')
+    return "utf-8"
+
+
+def _conditional_headers(entry: Optional[dict]) -> dict:
+    """If-None-Match/If-Modified-Since headers for revalidating a cache entry."""
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+class _HostSlots:
+    """
+    Per-host semaphores allowing ``per_host`` requests at a time. A host's
+    semaphore exists only while requests to it are running or waiting, so
+    the table stays as small as the set of hosts in flight.
+    """
+
+    def __init__(self, per_host: int, semaphore=threading.BoundedSemaphore):
+        self.per_host = per_host
+        self._semaphore = semaphore
+        self._slots: Dict[str, list] = {}  # host -> [semaphore, requests holding or waiting]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _enter(self, url: str):
+        host = (urlsplit(url).hostname or "").lower()
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = [self._semaphore(self.per_host), 0]
+            slot[1] += 1
+        return host, slot
+
+    def _exit(self, host: str, slot: list):
+        with self._lock:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._slots[host]
+
+    @contextmanager
+    def hold(self, url: str):
+        host, slot = self._enter(url)
+        try:
+            with slot[0]:
+                yield
+        finally:
+            self._exit(host, slot)
+
+    @asynccontextmanager
+    async def async_hold(self, url: str):
+        host, slot = self._enter(url)
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            self._exit(host, slot)
+
+
+class PageFetcher(OutcomeCounter):
+    """
+    Pooled, bounded page fetcher.
+
+    A single keep-alive ``requests.Session`` is shared by every caller, so
+    repeated hosts reuse TCP/TLS connections. At most ``per_host`` requests run
+    against one host at a time. Bodies are streamed and only the first
+    ``max_bytes`` of an HTML response are read; anything that is not HTML is
+    rejected from its headers without downloading the body. Text extraction
+    runs on ``extractor`` when given, otherwise on the calling thread.
+    """
+
+    outcome_names = ("fetched", "failed")
+
+    def __init__(self, cache: Optional[PageCache] = None, max_bytes: int = 512 * 1024,
+                 per_host: int = 4, pool_size: int = 32, extractor: Optional[ExtractionPool] = None):
+        super().__init__()
+        self.cache = cache
+        self.extractor = extractor
+        self.max_bytes = max_bytes
+        self.per_host = per_host
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = _HostSlots(per_host)
+
+    def fetch_html(self, url: str, timeout: float = 10, headers: Optional[dict] = None):
+        """
+        GET ``url`` and return ``(response, html)``.
+
+        ``html`` is None when the response is not a successful HTML page; the
+        response is still returned so callers can inspect status and validators.
+        """
+        with self._host_slots.hold(url):
+            with self.session.get(url, timeout=timeout, headers=headers, stream=True) as resp:
+                content_type = resp.headers.get('Content-Type', '')
+                if not resp.ok or 'text/html' not in content_type:
+                    return resp, None
+                body = bytearray()
+                for chunk in resp.iter_content(chunk_size=16 * 1024):
+                    body += chunk
+                    if len(body) >= self.max_bytes:
+                        break
+                html = bytes(body[:self.max_bytes]).decode(_response_encoding(content_type), errors="replace")
+                return resp, html
+
+    def fetch_text(self, url: str, timeout: float = 10) -> Optional[str]:
+        """
+        Return the extracted text of ``url``, or None if it is not HTML or
+        cannot be fetched.
+
+        With a cache, fresh entries are returned without a request and stale
+        ones are revalidated with If-None-Match/If-Modified-Since, so an
+        unchanged page costs a 304 instead of a download and a readability pass.
+        """
+        cache = self.cache
+        try:
+            entry = cache.get(url) if cache is not None else None
+        except Exception:
+            cache = entry = None  # no usable cache key (e.g. an invalid port): fetch uncached
+        if entry is not None and entry["fresh"]:
+            cache.record(True)
+            return entry["text"]
+        try:
+            with span("fetch", url=url) as fetch_span:
+                resp, html = self.fetch_html(url, timeout=timeout, headers=_conditional_headers(entry))
+                fetch_span.set(status=resp.status_code, bytes=len(html or ""))
+        except Exception:
+            self.record(False)
+            return None
+        if entry is not None and resp.status_code == 304:
+            cache.touch(url)
+            cache.record(True)
+            return entry["text"]
+        if cache is not None:
+            cache.record(False)
+        if not resp.ok:
+            self.record(False)
+            return None
+        text = None
+        if html is not None:
+            try:
+                with span("extract", url=url):
+                    text = self.extractor.extract(html) if self.extractor else extract_text(html)
+            except Exception:
+                self.record(False)
+                return None
+        self.record(text is not None)
+        if cache is not None:
+            cache.put(url, text, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        return text
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncPageFetcher(OutcomeCounter):
+    """
+    Async counterpart of PageFetcher for code running on an event loop.
+
+    Requests go through a pooled ``httpx.AsyncClient`` with per-host
+    semaphores and the same streamed ``max_bytes`` limit, and readability runs
+    on ``extractor`` (the loop's default thread pool when None), so many pages
+    can be in flight without blocking the loop. The client is created lazily
+    and rebuilt if the fetcher is used from a different event loop; each
+    client is closed on its own loop when that loop shuts down (as at the end
+    of ``asyncio.run()``) or by aclose().
+    """
+
+    outcome_names = ("fetched", "failed")
+
+    def __init__(self, cache: Optional[PageCache] = None, max_bytes: int = 512 * 1024,
+                 per_host: int = 4, pool_size: int = 32, extractor: Optional[ExtractionPool] = None):
+        super().__init__()
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.per_host = per_host
+        self.pool_size = pool_size
+        self.extractor = extractor
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lifetime = None
+        self._loop = None
+        self._host_slots = _HostSlots(per_host, asyncio.Semaphore)
+
+    @staticmethod
+    async def _client_lifetime(client: httpx.AsyncClient):
+        """
+        Suspended for as long as ``client`` is in use. An async generator is
+        closed by its loop's shutdown_asyncgens() (or finalized on its loop
+        once unreferenced), which closes the client's pool on the right loop.
+        """
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    async def _client_for_loop(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._lifetime = self._client_lifetime(self._client)
+            await self._lifetime.asend(None)
+            self._loop = loop
+            self._host_slots = _HostSlots(self.per_host, asyncio.Semaphore)
+        return self._client
+
+    async def fetch_html(self, url: str, timeout: float = 10, headers: Optional[dict] = None):
+        """Async version of PageFetcher.fetch_html()."""
+        client = await self._client_for_loop()
+        async with self._host_slots.async_hold(url):
+            async with client.stream("GET", url, timeout=timeout, headers=headers) as resp:
+                content_type = resp.headers.get('Content-Type', '')
+                if not resp.is_success or 'text/html' not in content_type:
+                    return resp, None
+                body = bytearray()
+                async for chunk in resp.aiter_bytes(16 * 1024):
+                    body += chunk
+                    if len(body) >= self.max_bytes:
+                        break
+                html = bytes(body[:self.max_bytes]).decode(_response_encoding(content_type), errors="replace")
+                return resp, html
+
+    async def extract(self, html: str) -> str:
+        """Run extract_text() off the event loop."""
+        if self.extractor is not None:
+            return await self.extractor.async_extract(html)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, extract_text, html)
+
+    async def fetch_text(self, url: str, timeout: float = 10) -> Optional[str]:
+        """Async version of PageFetcher.fetch_text(); the SQLite cache is used from a worker thread."""
+        cache = self.cache
+        try:
+            entry = await asyncio.to_thread(cache.get, url) if cache is not None else None
+        except Exception:
+            cache = entry = None
+        if entry is not None and entry["fresh"]:
+            cache.record(True)
+            return entry["text"]
+        try:
+            with span("fetch", url=url) as fetch_span:
+                resp, html = await self.fetch_html(url, timeout=timeout, headers=_conditional_headers(entry))
+                fetch_span.set(status=resp.status_code, bytes=len(html or ""))
+        except Exception:
+            self.record(False)
+            return None
+        if entry is not None and resp.status_code == 304:
+            await asyncio.to_thread(cache.touch, url)
+            cache.record(True)
+            return entry["text"]
+        if cache is not None:
+            cache.record(False)
+        if not resp.is_success:
+            self.record(False)
+            return None
+        text = None
+        if html is not None:
+            try:
+                with span("extract", url=url):
+                    text = await self.extract(html)
+            except Exception:
+                self.record(False)
+                return None
+        self.record(text is not None)
+        if cache is not None:
+            await asyncio.to_thread(cache.put, url, text, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        return text
+
+    async def aclose(self):
+        if self._lifetime is not None:
+            await self._lifetime.aclose()
+            self._client = self._lifetime = None
@@ -3,74 +3,877 @@
 IntegrataLlama: Unified interface for chat, moderation, web search, and tool calls.
 """
 
+import asyncio
+import functools
 import os
-from llama_api_client import LlamaAPIClient, AsyncLlamaAPIClient
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Literal
+from llama_api_client import APIError, LlamaAPIClient, AsyncLlamaAPIClient
+from pydantic import BaseModel
+from integrata_cache import CompletionCache, IntentCache, ModerationCache, PageCache, SearchCache, normalize_url
+from integrata_concurrency import async_batch_runner
+from integrata_extract import ExtractionPool
+from integrata_fetch import AsyncPageFetcher, PageFetcher
+from integrata_ratelimit import AsyncRateLimitedLlamaClient, RateLimitedLlamaClient, RateLimiter
+from integrata_session import HISTORY_TOKENS, SessionStore
+from integrata_tokens import UsageTracker, split_tokens, truncate_tokens
+from integrata_trace import activate, span, submit
+
+CHAT_MODEL = "Llama-4-Maverick-17B-128E-Instruct-FP8"
+SUMMARY_MODEL = "Llama-3.3-70B-Instruct"
+# Small, fast model that picks the actions for /reason
+ROUTER_MODEL = "Llama-3.3-8B-Instruct"
+# After the router model fails it is skipped for this many seconds, so a
+# broken model costs one failed call per window instead of one per request
+ROUTER_RETRY_AFTER = 30
+
+# Default token budget for the page text in one summary prompt, and the most
+# chunks a map-reduce summary will read from a single page
+PAGE_TOKENS = 1000
+MAX_PAGE_CHUNKS = 8
+
+
+def _completion_text(response):
+    """Extract the text content of a non-streaming chat completion."""
+    content = response.completion_message.content
+    return content.text if hasattr(content, 'text') else str(content)
+
+
+class _Intents(BaseModel):
+    """Structured output of the intent classifier."""
+    intents: List[Literal["moderate", "web_search", "weather", "chat"]]
+
+
+INTENT_PROMPT = (
+    "You route requests to tools. List every action the user's message asks for:\n"
+    "- moderate: check whether the content is safe or allowed\n"
+    "- web_search: look something up on the web\n"
+    "- weather: get the weather for a place\n"
+    "- chat: anything else; only on its own\n"
+    "Answer with a JSON object."
+)
+
+
+def _clean_intents(intents):
+    """Dedupe classifier output into a fixed order; chat only when nothing else applies."""
+    actions = [intent for intent in ("moderate", "web_search", "weather") if intent in intents]
+    return actions or ["chat"]
+
+
+def is_flagged(moderation):
+    """True if any result of a moderations.create response was flagged."""
+    return any(result.flagged for result in getattr(moderation, "results", None) or [])
+
+
+class ContentFlagged(Exception):
+    """Raised by the guarded chat methods when moderation flags the input."""
+
+    def __init__(self, categories):
+        self.categories = list(categories)
+        super().__init__(f"Input flagged by moderation: {', '.join(self.categories) or 'unsafe'}")
+
+
+def _raise_if_flagged(moderation):
+    if is_flagged(moderation):
+        raise ContentFlagged(c for result in moderation.results for c in result.flagged_categories)
+
+
+def _ddgs_text(query, max_results):
+    from ddgs import DDGS
+    with span("ddgs.text", query=query, max_results=max_results):
+        return list(DDGS().text(query, max_results=max_results))
+
+
+def _failed_summary(result, error):
+    """Stand-in summary for a search hit whose pipeline raised; keeps rank positions aligned."""
+    return {
+        "title": result.get('title') or '',
+        "url": result.get('href') or result.get('url'),
+        "summary": result.get('body') or result.get('snippet') or '',
+        "error": str(error),
+    }
+
+
+def _future_summary(result, future):
+    """The summary ``future`` resolves to, or _failed_summary() if its pipeline raised."""
+    try:
+        return future.result()
+    except Exception as e:
+        return _failed_summary(result, e)
+
+
+def _dedupe_hits(hits):
+    """
+    Collapse the hits of several queries to one entry per normalized URL.
+
+    Returns ``(unique, keys_by_query)``: the first hit seen for each key, and
+    each query's keys in rank order. Hits without a URL, or with one that
+    cannot be normalized, are never shared.
+    """
+    unique = {}
+    keys_by_query = {}
+    for query, results in hits.items():
+        keys = keys_by_query[query] = []
+        for rank, result in enumerate(results, 1):
+            url = result.get('href') or result.get('url')
+            try:
+                key = normalize_url(url) if url else f"{query}#{rank}"
+            except ValueError:
+                key = f"{query}#{rank}"
+            unique.setdefault(key, result)
+            keys.append(key)
+    return unique, keys_by_query
+
+
+def _delta_text(chunk):
+    """Return the text of a streamed chunk, or '' for tool-call and metrics events."""
+    return getattr(chunk.event.delta, 'text', None) or ''
 
 class IntegrataLlama:
     """
     Integrates chat, moderation, web search, and tool call functionalities.
     """
-    def __init__(self):
-        self.client = LlamaAPIClient()
-        self.async_client = AsyncLlamaAPIClient(api_key=os.getenv("LLAMA_API_KEY"))
+    def __init__(self, page_cache=None, completion_cache=None, fetcher=None, async_fetcher=None, extractor=None,
+                 rate_limiter=None, search_cache=None, usage=None, sessions=None, intent_cache=None,
+                 moderation_cache=None):
+        # Both clients share one limiter so sync and async traffic draw from the same budget
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.from_env()
+        self.usage = usage if usage is not None else UsageTracker()
+        self.client = RateLimitedLlamaClient(LlamaAPIClient(), self.rate_limiter, self.usage)
+        self.async_client = AsyncRateLimitedLlamaClient(
+            AsyncLlamaAPIClient(api_key=os.getenv("LLAMA_API_KEY")), self.rate_limiter, self.usage
+        )
+        self.page_cache = page_cache if page_cache is not None else PageCache()
+        self.completion_cache = completion_cache if completion_cache is not None else CompletionCache()
+        self.moderation_cache = moderation_cache if moderation_cache is not None else ModerationCache()
+        self.search_cache = search_cache if search_cache is not None else SearchCache()
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self._compactions = set()  # background compaction tasks, referenced until done
+        self.intent_cache = intent_cache if intent_cache is not None else IntentCache()
+        self._router_failed_at = None
+        self.extractor = extractor if extractor is not None else ExtractionPool()
+        self.fetcher = fetcher if fetcher is not None else PageFetcher(cache=self.page_cache, extractor=self.extractor)
+        self.async_fetcher = async_fetcher if async_fetcher is not None else AsyncPageFetcher(
+            cache=self.page_cache, extractor=self.extractor
+        )
 
-    def chat(self, message, stream=False, **kwargs):
-        """Send a message to the chat model and return the response."""
+    @property
+    def coalesced_calls(self):
+        """Number of API calls served by an identical call already in flight."""
+        return self.client.coalesced + self.async_client.coalesced
+
+    def usage_stats(self):
+        """Per-model token counts, tokens/sec and cost of the calls made so far."""
+        return self.usage.snapshot()
+
+    def chat(self, message, stream=False, use_cache=True, **kwargs):
+        """
+        Send a message to the chat model and return the response.
+
+        With ``stream=True`` the deltas are joined into a single string; use
+        stream_chat() to consume them as they arrive. Non-streaming responses
+        are memoized unless ``use_cache=False``.
+        """
+        if stream:
+            return "".join(self.stream_chat(message))
+        messages = [{"role": "user", "content": message}]
+        response = self.completion_cache.create(
+            self.client,
+            use_cache=use_cache,
+            model=CHAT_MODEL,
+            messages=messages,
+            max_completion_tokens=1024,
+            temperature=0.7,
+        )
+        return response.completion_message.model_dump()
+
+    def stream_chat(self, message):
+        """Yield the chat model's text deltas as soon as each one arrives."""
         messages = [{"role": "user", "content": message}]
         response = self.client.chat.completions.create(
-            model="Llama-4-Maverick-17B-128E-Instruct-FP8",
+            model=CHAT_MODEL,
             messages=messages,
             max_completion_tokens=1024,
             temperature=0.7,
-            stream=stream,
+            stream=True,
         )
+        for chunk in response:
+            text = _delta_text(chunk)
+            if text:
+                yield text
+
+    async def async_chat(self, message, stream=False, use_cache=True, **kwargs):
+        """Async version of chat() backed by the AsyncLlamaAPIClient."""
         if stream:
-            return "".join(chunk.event.delta.text for chunk in response)
-        else:
-            return response.completion_message.model_dump()
+            return "".join([text async for text in self.async_stream_chat(message)])
+        messages = [{"role": "user", "content": message}]
+        response = await self.completion_cache.async_create(
+            self.async_client,
+            use_cache=use_cache,
+            model=CHAT_MODEL,
+            messages=messages,
+            max_completion_tokens=1024,
+            temperature=0.7,
+        )
+        return response.completion_message.model_dump()
+
+    async def async_stream_chat(self, message):
+        """Async version of stream_chat()."""
+        messages = [{"role": "user", "content": message}]
+        response = await self.async_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            max_completion_tokens=1024,
+            temperature=0.7,
+            stream=True,
+        )
+        async for chunk in response:
+            text = _delta_text(chunk)
+            if text:
+                yield text
+
+    def moderate(self, content, use_cache=True):
+        """
+        Moderate content using the moderation endpoint. Results are cached by
+        content hash unless ``use_cache=False``.
+        """
+        messages = [{"role": "user", "content": content}]
+        return self.moderation_cache.create(self.client, use_cache=use_cache, messages=messages)
 
-    def moderate(self, content):
-        """Moderate content using the moderation endpoint."""
+    async def async_moderate(self, content, use_cache=True):
+        """Async version of moderate()."""
         messages = [{"role": "user", "content": content}]
-        response = self.client.moderations.create(messages=messages)
+        return await self.moderation_cache.async_create(self.async_client, use_cache=use_cache, messages=messages)
+
+    def moderate_many(self, contents, concurrency=16, use_cache=True):
+        """
+        Moderate each of ``contents`` and return the results in input order.
+
+        The moderation endpoint reads its messages as one conversation, so
+        items are not packed into a request; each gets its own, at most
+        ``concurrency`` at a time under the shared rate limiter. Duplicates
+        are sent once and cached content not at all. An item that failed
+        leaves its exception in its slot.
+        """
+        unique = list(dict.fromkeys(contents))
+        if not unique:
+            return []
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(unique))) as pool:
+            futures = [submit(pool, self.moderate, content, use_cache) for content in unique]
+        results = {}
+        for content, future in zip(unique, futures):
+            try:
+                results[content] = future.result()
+            except Exception as e:
+                results[content] = e
+        return [results[content] for content in contents]
+
+    async def async_moderate_many(self, contents, concurrency=16, use_cache=True):
+        """Async version of moderate_many()."""
+        unique = list(dict.fromkeys(contents))
+        outcomes = await async_batch_runner(
+            [functools.partial(self.async_moderate, content, use_cache) for content in unique],
+            batch_size=concurrency,
+            max_loops=1,
+        )
+        results = dict(zip(unique, outcomes))
+        return [results[content] for content in contents]
+
+    def guarded_chat(self, message, use_cache=True):
+        """
+        chat() that only answers if moderation passes, without waiting for it
+        first: moderation runs in a worker thread while the chat call is made.
+        Raises ContentFlagged if the input is flagged. A sync call cannot be
+        cancelled, so a flagged input still costs its generation.
+        """
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            moderation = submit(pool, self.moderate, message)
+            response = self.chat(message, use_cache=use_cache)
+            _raise_if_flagged(moderation.result())
         return response
 
-    def web_search(self, query, max_results=8):
-        """Perform a DuckDuckGo web search and summarize results with Llama."""
-        from ddgs import DDGS
-        import requests
-        from readability import Document
-        import time
-        ddgs = DDGS()
-        results = list(ddgs.text(query, max_results=max_results))
-        summaries = []
-        for result in results:
-            url = result.get('href') or result.get('url')
-            snippet = result.get('body') or result.get('snippet') or ''
-            title = result.get('title') or ''
-            page_text = None
-            if url:
+    def guarded_stream_chat(self, message):
+        """
+        stream_chat() guarded by moderation running alongside it. Deltas that
+        arrive before moderation passes are held back, then released.
+        """
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            moderation = submit(pool, self.moderate, message)
+            stream = self.stream_chat(message)
+            held = []
+            try:
+                for text in stream:
+                    if moderation is not None:
+                        if not moderation.done():
+                            held.append(text)
+                            continue
+                        _raise_if_flagged(moderation.result())
+                        moderation = None
+                        yield from held
+                    yield text
+                if moderation is not None:
+                    _raise_if_flagged(moderation.result())
+                    yield from held
+            finally:
+                stream.close()
+
+    async def async_guarded_chat(self, message, use_cache=True):
+        """
+        Async guarded_chat(): moderation and generation start together and
+        the generation is cancelled as soon as moderation flags the input.
+        """
+        chat = asyncio.ensure_future(self.async_chat(message, use_cache=use_cache))
+        try:
+            _raise_if_flagged(await self.async_moderate(message))
+            return await chat
+        finally:
+            chat.cancel()
+
+    async def async_guarded_stream_chat(self, message):
+        """
+        Async guarded_stream_chat(). The stream is read into a buffer while
+        moderation runs; the buffered deltas are released once it passes, and
+        the stream is cancelled if it fails.
+        """
+        moderation = asyncio.ensure_future(self.async_moderate(message))
+        deltas = asyncio.Queue()
+
+        async def pump():
+            stream = self.async_stream_chat(message)
+            try:
+                async for text in stream:
+                    deltas.put_nowait(text)
+                deltas.put_nowait(None)
+            except Exception as e:
+                deltas.put_nowait(e)
+            finally:
+                await stream.aclose()
+
+        reader = asyncio.ensure_future(pump())
+        try:
+            _raise_if_flagged(await moderation)
+            while True:
+                item = await deltas.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            moderation.cancel()
+            reader.cancel()
+
+    def _intent_request(self, user_input):
+        return dict(
+            model=ROUTER_MODEL,
+            messages=[
+                {"role": "system", "content": INTENT_PROMPT},
+                {"role": "user", "content": user_input},
+            ],
+            max_completion_tokens=64,
+            temperature=0,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "Intents", "schema": _Intents.model_json_schema()},
+            },
+        )
+
+    def _check_router(self):
+        failed_at = self._router_failed_at
+        if failed_at is not None and time.monotonic() - failed_at < ROUTER_RETRY_AFTER:
+            raise RuntimeError(f"Intent classifier failed less than {ROUTER_RETRY_AFTER}s ago")
+
+    def _parse_intents(self, user_input, response):
+        intents = _clean_intents(_Intents.model_validate_json(_completion_text(response)).intents)
+        self.intent_cache.set(user_input, intents)
+        return list(intents)
+
+    def classify_intents(self, user_input):
+        """
+        Pick the actions ``user_input`` asks for with the router model.
+
+        Returns ``(intents, source)``; ``source`` is "cache" when the same
+        input was classified before and "model" otherwise. Raises if the model
+        call fails or its answer does not match the schema. After a failed call
+        (not a bad answer) it raises without calling for ROUTER_RETRY_AFTER seconds.
+        """
+        intents = self.intent_cache.get(user_input)
+        if intents is not None:
+            return list(intents), "cache"
+        self._check_router()
+        try:
+            with span("classify", model=ROUTER_MODEL):
+                response = self.client.chat.completions.create(**self._intent_request(user_input))
+        except APIError:
+            self._router_failed_at = time.monotonic()
+            raise
+        return self._parse_intents(user_input, response), "model"
+
+    async def async_classify_intents(self, user_input):
+        """Async version of classify_intents()."""
+        intents = self.intent_cache.get(user_input)
+        if intents is not None:
+            return list(intents), "cache"
+        self._check_router()
+        try:
+            with span("classify", model=ROUTER_MODEL):
+                response = await self.async_client.chat.completions.create(**self._intent_request(user_input))
+        except APIError:
+            self._router_failed_at = time.monotonic()
+            raise
+        return self._parse_intents(user_input, response), "model"
+
+    def create_session(self, system=None, max_history_tokens=HISTORY_TOKENS):
+        """Start a server-side conversation; continue it with session_chat() and friends."""
+        return self.sessions.create(system=system, max_history_tokens=max_history_tokens)
+
+    def _session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"Unknown or expired session '{session_id}'")
+        return session
+
+    def _history_prompt(self, summary, turns, max_tokens):
+        """Fold the oldest turns of a conversation (and its earlier summary) into one summary."""
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        earlier = f"Summary so far:\n{summary}\n\n" if summary else ""
+        return ("Summarize this conversation so it can be continued without the transcript. "
+                "Keep names, facts, decisions and open questions.\n\n"
+                f"{earlier}Transcript:\n{truncate_tokens(transcript, max_tokens)}")
+
+    def _compact_session(self, session):
+        """Fold the oldest turns into the summary once history passes its token budget."""
+        old = session.start_compaction()
+        if old is None:
+            return
+        try:
+            with span("compact", turns=len(old), history_tokens=session.history_tokens):
+                try:
+                    summary = self._summarize(
+                        self._history_prompt(session.summary, old, 2 * session.max_history_tokens), use_cache=False
+                    )
+                except Exception:
+                    summary = None  # drop the old turns rather than let the prompt grow
+            session.fold(len(old), summary)
+        finally:
+            session.end_compaction()
+
+    async def _async_compact_session(self, session):
+        """Async version of _compact_session()."""
+        old = session.start_compaction()
+        if old is None:
+            return
+        try:
+            with span("compact", turns=len(old), history_tokens=session.history_tokens):
                 try:
-                    resp = requests.get(url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-                    if resp.ok and 'text/html' in resp.headers.get('Content-Type', ''):
-                        doc = Document(resp.text)
-                        import re
-                        page_text = re.sub('<[^<]+?>', '', doc.summary(html_partial=False))[:4000]
+                    summary = await self._async_summarize(
+                        self._history_prompt(session.summary, old, 2 * session.max_history_tokens), use_cache=False
+                    )
                 except Exception:
-                    pass
-            if page_text:
-                prompt = f"Summarize this web page concisely for search results. Focus on key information.\n\nTitle: {title}\nURL: {url}\nContent: {page_text}"
-            else:
-                prompt = f"Summarize this search result concisely.\n\nTitle: {title}\nSnippet: {snippet}\nURL: {url}"
-            summary_resp = self.client.chat.completions.create(
-                model="Llama-3.3-70B-Instruct",
+                    summary = None
+            session.fold(len(old), summary)
+        finally:
+            session.end_compaction()
+
+    def _compact_in_background(self, session):
+        """
+        Compact ``session`` on a daemon thread once a turn has been answered,
+        so the summary call never delays a reply.
+        """
+        if session.needs_compaction():
+            threading.Thread(target=self._compact_session, args=(session,), daemon=True).start()
+
+    def _async_compact_in_background(self, session):
+        """Async version of _compact_in_background(), as a task on the running loop."""
+        if session.needs_compaction():
+            task = asyncio.get_running_loop().create_task(self._async_compact_session(session))
+            self._compactions.add(task)
+            task.add_done_callback(self._compactions.discard)
+
+    def session_chat(self, session_id, message):
+        """
+        Answer ``message`` in the context of a session and add the exchange to
+        its history. Raises KeyError for an unknown session and SessionBusy if
+        the session is already answering another message.
+        """
+        session = self._session(session_id)
+        session.begin_turn()
+        try:
+            response = self.client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=session.messages(message),
+                max_completion_tokens=1024,
+                temperature=0.7,
+            )
+            session.add_exchange(message, _completion_text(response))
+            return response.completion_message.model_dump()
+        finally:
+            session.end_turn()
+            self._compact_in_background(session)
+
+    def stream_session_chat(self, session_id, message):
+        """Streaming session_chat(); the exchange is recorded once the stream completes."""
+        session = self._session(session_id)
+        session.begin_turn()
+        try:
+            response = self.client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=session.messages(message),
+                max_completion_tokens=1024,
+                temperature=0.7,
+                stream=True,
+            )
+            parts = []
+            for chunk in response:
+                text = _delta_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+            session.add_exchange(message, "".join(parts))
+        finally:
+            session.end_turn()
+            self._compact_in_background(session)
+
+    async def async_session_chat(self, session_id, message):
+        """Async version of session_chat()."""
+        session = self._session(session_id)
+        session.begin_turn()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=session.messages(message),
+                max_completion_tokens=1024,
+                temperature=0.7,
+            )
+            session.add_exchange(message, _completion_text(response))
+            return response.completion_message.model_dump()
+        finally:
+            session.end_turn()
+            self._async_compact_in_background(session)
+
+    async def async_stream_session_chat(self, session_id, message):
+        """Async version of stream_session_chat()."""
+        session = self._session(session_id)
+        session.begin_turn()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=session.messages(message),
+                max_completion_tokens=1024,
+                temperature=0.7,
+                stream=True,
+            )
+            parts = []
+            async for chunk in response:
+                text = _delta_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+            session.add_exchange(message, "".join(parts))
+        finally:
+            session.end_turn()
+            self._async_compact_in_background(session)
+
+    def web_search(self, query, max_results=8, concurrency=8, fetch_timeout=10, summary_timeout=60, use_cache=True,
+                   page_tokens=PAGE_TOKENS, map_reduce=False, trace=None):
+        """
+        Perform a DuckDuckGo web search and summarize results with Llama.
+
+        Page fetches and summaries run concurrently on up to ``concurrency``
+        worker threads; results are returned in the original search rank order.
+        ``fetch_timeout`` and ``summary_timeout`` bound each stage per result.
+        Summaries are memoized by prompt unless ``use_cache=False``.
+
+        ``page_tokens`` is the token budget for page text in one summary
+        prompt; longer pages keep their leading paragraphs. With
+        ``map_reduce=True`` long pages are instead split into chunks of
+        ``page_tokens`` (at most MAX_PAGE_CHUNKS), summarized in parallel and
+        merged by one more call.
+
+        Pass an integrata_trace.Trace as ``trace`` to record how long the
+        search, each page fetch, extraction and Llama call took; each result
+        then carries its own stages under ``"timings"``.
+        """
+        with activate(trace):
+            results = self._search(query, max_results)
+            if not results:
+                return []
+            workers = max(1, min(concurrency, len(results)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    submit(pool, self._summarize_result, result, fetch_timeout, summary_timeout, use_cache,
+                           page_tokens, map_reduce)
+                    for result in results
+                ]
+                return [_future_summary(result, future) for result, future in zip(results, futures)]
+
+    async def async_web_search(self, query, max_results=8, concurrency=8, fetch_timeout=10, summary_timeout=60,
+                               use_cache=True, page_tokens=PAGE_TOKENS, map_reduce=False, trace=None):
+        """
+        Async version of web_search().
+
+        Results are summarized through async_batch_runner with at most
+        ``concurrency`` results in flight and come back in rank order.
+        """
+        with activate(trace):
+            results = await asyncio.to_thread(self._search, query, max_results)
+            callables = [
+                lambda r=r: self._async_summarize_result(
+                    r, fetch_timeout, summary_timeout, use_cache, page_tokens, map_reduce
+                )
+                for r in results
+            ]
+            summaries = await async_batch_runner(callables, batch_size=max(1, concurrency), max_loops=1)
+        return [
+            _failed_summary(r, summary) if isinstance(summary, Exception) else summary
+            for r, summary in zip(results, summaries)
+        ]
+
+    def web_search_many(self, queries, max_results=8, concurrency=16, fetch_timeout=10, summary_timeout=60,
+                        use_cache=True, page_tokens=PAGE_TOKENS, map_reduce=False, trace=None):
+        """
+        Run several web searches at once and return ``{query: [summary, ...]}``.
+
+        A URL that shows up under several queries is fetched and summarized
+        once and shared between them. ``concurrency`` is the worker budget for
+        the whole batch, not per query.
+        """
+        queries = list(dict.fromkeys(queries))
+        with activate(trace), ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            searches = [submit(pool, self._search, q, max_results, raise_errors=False) for q in queries]
+            hits = {query: future.result() for query, future in zip(queries, searches)}
+            unique, keys_by_query = _dedupe_hits(hits)
+            futures = {
+                key: submit(pool, self._summarize_result, result, fetch_timeout, summary_timeout, use_cache,
+                            page_tokens, map_reduce)
+                for key, result in unique.items()
+            }
+            summaries = {key: _future_summary(unique[key], future) for key, future in futures.items()}
+        return {query: [summaries[key] for key in keys] for query, keys in keys_by_query.items()}
+
+    async def async_web_search_many(self, queries, max_results=8, concurrency=16, fetch_timeout=10,
+                                    summary_timeout=60, use_cache=True, page_tokens=PAGE_TOKENS, map_reduce=False,
+                                    trace=None):
+        """Async version of web_search_many()."""
+        ranked = {query: {} for query in dict.fromkeys(queries)}
+        async for event in self.async_web_search_many_stream(
+            queries, max_results, concurrency, fetch_timeout, summary_timeout, use_cache, page_tokens, map_reduce,
+            trace,
+        ):
+            ranked[event["query"]][event["rank"]] = event["summary"]
+        return {query: [by_rank[rank] for rank in sorted(by_rank)] for query, by_rank in ranked.items()}
+
+    async def async_web_search_many_stream(self, queries, max_results=8, concurrency=16, fetch_timeout=10,
+                                           summary_timeout=60, use_cache=True, page_tokens=PAGE_TOKENS,
+                                           map_reduce=False, trace=None):
+        """
+        Like async_web_search_many(), but yield ``{"query", "rank", "summary"}``
+        events as soon as each unique page is summarized. A page shared by
+        several queries yields one event per query. Ranks start at 1.
+        """
+        queries = list(dict.fromkeys(queries))
+        slots = asyncio.Semaphore(max(1, concurrency))
+
+        async def search(query):
+            async with slots:
+                return await asyncio.to_thread(self._search, query, max_results, False)
+
+        # The trace is only active while tasks are created: they keep a copy of
+        # the context, while this generator's own context is the consumer's
+        with activate(trace):
+            searching = asyncio.gather(*(search(q) for q in queries))
+        hits = dict(zip(queries, await searching))
+        unique, keys_by_query = _dedupe_hits(hits)
+        refs = {}
+        for query, keys in keys_by_query.items():
+            for rank, key in enumerate(keys, 1):
+                refs.setdefault(key, []).append((query, rank))
+
+        async for key, summary in self._summarize_as_completed(
+            unique, concurrency, fetch_timeout, summary_timeout, use_cache, page_tokens, map_reduce, trace
+        ):
+            for query, rank in refs[key]:
+                yield {"query": query, "rank": rank, "summary": summary}
+
+    async def async_web_search_stream(self, query, max_results=8, concurrency=8, fetch_timeout=10,
+                                      summary_timeout=60, use_cache=True, page_tokens=PAGE_TOKENS, map_reduce=False,
+                                      trace=None):
+        """
+        Streaming version of async_web_search().
+
+        Yields one ``{"type": "hits", "hits": [...]}`` event with the raw
+        DuckDuckGo results as soon as the search returns, then a
+        ``{"type": "summary", "rank": n, "summary": {...}}`` event for each
+        result as its summary finishes, in completion order. Ranks start at 1.
+        """
+        with activate(trace):
+            searching = asyncio.ensure_future(asyncio.to_thread(self._search, query, max_results))
+        results = await searching
+        yield {
+            "type": "hits",
+            "hits": [
+                {
+                    "rank": rank,
+                    "title": r.get('title') or '',
+                    "url": r.get('href') or r.get('url'),
+                    "snippet": r.get('body') or r.get('snippet') or '',
+                }
+                for rank, r in enumerate(results, 1)
+            ],
+        }
+        by_rank = dict(enumerate(results, 1))
+        async for rank, summary in self._summarize_as_completed(
+            by_rank, concurrency, fetch_timeout, summary_timeout, use_cache, page_tokens, map_reduce, trace
+        ):
+            yield {"type": "summary", "rank": rank, "summary": summary}
+
+    async def _summarize_as_completed(self, results, concurrency, fetch_timeout, summary_timeout, use_cache,
+                                      page_tokens=PAGE_TOKENS, map_reduce=False, trace=None):
+        """
+        Summarize ``{key: hit}`` with at most ``concurrency`` in flight,
+        yielding ``(key, summary)`` pairs as each one finishes.
+        """
+        done = asyncio.Queue()
+
+        async def summarize(key):
+            try:
+                summary = await self._async_summarize_result(
+                    results[key], fetch_timeout, summary_timeout, use_cache, page_tokens, map_reduce
+                )
+            except Exception as e:
+                summary = _failed_summary(results[key], e)
+            await done.put((key, summary))
+
+        with activate(trace):
+            runner = asyncio.create_task(async_batch_runner(
+                [lambda k=k: summarize(k) for k in results], batch_size=max(1, concurrency), max_loops=1
+            ))
+        try:
+            for _ in range(len(results)):
+                yield await done.get()
+            await runner
+        finally:
+            runner.cancel()
+
+    def _search(self, query, max_results=8, raise_errors=True):
+        """Return the raw DuckDuckGo hits for ``query`` (via the search cache)."""
+        try:
+            with span("search", query=query, max_results=max_results) as search_span:
+                hits = self.search_cache.get_or_search(query, max_results, _ddgs_text)
+                search_span.set(hits=len(hits))
+                return hits
+        except Exception:
+            if raise_errors:
+                raise
+            return []
+
+    async def _async_summarize_result(self, result, fetch_timeout=10, summary_timeout=60, use_cache=True,
+                                      page_tokens=PAGE_TOKENS, map_reduce=False):
+        """Async version of _summarize_result() using the non-blocking page fetcher."""
+        url = result.get('href') or result.get('url')
+        snippet = result.get('body') or result.get('snippet') or ''
+        title = result.get('title') or ''
+        with span("result", url=url or "") as result_span:
+            page_text = await self.async_fetcher.fetch_text(url, timeout=fetch_timeout) if url else None
+            # Tokenizing a long page takes milliseconds: keep it off the loop
+            chunks = await asyncio.to_thread(self._page_chunks, page_text, page_tokens, map_reduce)
+            try:
+                if len(chunks) <= 1:
+                    prompt = self._summary_prompt(title, url, snippet, chunks[0] if chunks else None)
+                    summary = await self._async_summarize(prompt, summary_timeout, use_cache)
+                else:
+                    parts = await asyncio.gather(*(
+                        self._async_summarize(self._chunk_prompt(title, url, chunk, i, len(chunks)), summary_timeout, use_cache)
+                        for i, chunk in enumerate(chunks, 1)
+                    ))
+                    summary = await self._async_summarize(self._merge_prompt(title, url, parts), summary_timeout, use_cache)
+                outcome = {"title": title, "url": url, "summary": summary}
+            except Exception as e:
+                outcome = {"title": title, "url": url, "summary": snippet, "error": str(e)}
+        return result_span.attach_timings(outcome)
+
+    async def _async_summarize(self, prompt, summary_timeout=60, use_cache=True):
+        """Async version of _summarize()."""
+        with span("summarize", prompt_chars=len(prompt)):
+            summary_resp = await self.completion_cache.async_create(
+                self.async_client,
+                use_cache=use_cache,
+                model=SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_completion_tokens=300,
+                temperature=0.7,
+                timeout=summary_timeout,
+            )
+        return _completion_text(summary_resp)
+
+    def _page_chunks(self, page_text, page_tokens=PAGE_TOKENS, map_reduce=False):
+        """
+        Fit page text to the prompt budget: its leading ``page_tokens`` tokens,
+        or with ``map_reduce`` up to MAX_PAGE_CHUNKS chunks of that size.
+        """
+        if not page_text:
+            return []
+        if map_reduce:
+            return split_tokens(page_text, page_tokens, MAX_PAGE_CHUNKS)
+        return [truncate_tokens(page_text, page_tokens)]
+
+    def _summary_prompt(self, title, url, snippet, page_text):
+        """Build the summarization prompt for a single search result."""
+        if page_text:
+            return f"Summarize this web page concisely for search results. Focus on key information.\n\nTitle: {title}\nURL: {url}\nContent: {page_text}"
+        return f"Summarize this search result concisely.\n\nTitle: {title}\nSnippet: {snippet}\nURL: {url}"
+
+    def _chunk_prompt(self, title, url, chunk, index, total):
+        """Map step of a chunked summary: summarize one part of a long page."""
+        return f"Summarize part {index} of {total} of this web page. Keep only the key facts.\n\nTitle: {title}\nURL: {url}\nContent: {chunk}"
+
+    def _merge_prompt(self, title, url, parts):
+        """Reduce step of a chunked summary: merge the part summaries into one."""
+        joined = "\n\n".join(f"Part {i}: {part}" for i, part in enumerate(parts, 1))
+        return f"Combine these summaries of consecutive parts of one web page into a single concise summary for search results.\n\nTitle: {title}\nURL: {url}\n\n{joined}"
+
+    def _summarize(self, prompt, summary_timeout=60, use_cache=True):
+        """Run one summary prompt on the summary model and return the text."""
+        with span("summarize", prompt_chars=len(prompt)):
+            summary_resp = self.completion_cache.create(
+                self.client,
+                use_cache=use_cache,
+                model=SUMMARY_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_completion_tokens=300,
                 temperature=0.7,
+                timeout=summary_timeout,
             )
-            summary = summary_resp.completion_message.content.text if hasattr(summary_resp.completion_message.content, 'text') else str(summary_resp.completion_message.content)
-            summaries.append({"title": title, "url": url, "summary": summary})
-        return summaries
+        return _completion_text(summary_resp)
+
+    def _summarize_result(self, result, fetch_timeout=10, summary_timeout=60, use_cache=True,
+                          page_tokens=PAGE_TOKENS, map_reduce=False):
+        """Fetch and summarize one search result; falls back to the snippet on error."""
+        url = result.get('href') or result.get('url')
+        snippet = result.get('body') or result.get('snippet') or ''
+        title = result.get('title') or ''
+        with span("result", url=url or "") as result_span:
+            page_text = self.fetcher.fetch_text(url, timeout=fetch_timeout) if url else None
+            chunks = self._page_chunks(page_text, page_tokens, map_reduce)
+            try:
+                if len(chunks) <= 1:
+                    prompt = self._summary_prompt(title, url, snippet, chunks[0] if chunks else None)
+                    summary = self._summarize(prompt, summary_timeout, use_cache)
+                else:
+                    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+                        futures = [
+                            submit(pool, self._summarize, self._chunk_prompt(title, url, chunk, i, len(chunks)),
+                                   summary_timeout, use_cache)
+                            for i, chunk in enumerate(chunks, 1)
+                        ]
+                        parts = [future.result() for future in futures]
+                    summary = self._summarize(self._merge_prompt(title, url, parts), summary_timeout, use_cache)
+                outcome = {"title": title, "url": url, "summary": summary}
+            except Exception as e:
+                outcome = {"title": title, "url": url, "summary": snippet, "error": str(e)}
+        return result_span.attach_timings(outcome)
 
     def tool_call(self, tool_name, *args, **kwargs):
         """Call a tool using the tool_call module's available functions."""
@@ -84,6 +887,10 @@ class IntegrataLlama:
         else:
             raise NotImplementedError(f"Tool '{tool_name}' is not implemented.")
 
+    async def async_tool_call(self, tool_name, *args, **kwargs):
+        """Async version of tool_call(); tools are synchronous so they run in a worker thread."""
+        return await asyncio.to_thread(self.tool_call, tool_name, *args, **kwargs)
+
 if __name__ == "__main__":
     llama = IntegrataLlama()
     print("Chat:", llama.chat("Hello!"))
@@ -1,53 +1,287 @@
 
-from fastapi import FastAPI, Request
+import asyncio
+import inspect
+import json
+import os
+import time
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.routing import Match
 from typing import Optional, List, Dict, Any
-from integrata_llama import IntegrataLlama
+from integrata_llama import PAGE_TOKENS, ContentFlagged, IntegrataLlama, is_flagged
+from integrata_metrics import ServiceMetrics
+from integrata_session import HISTORY_TOKENS, SessionBusy
+from integrata_trace import Trace
 
 app = FastAPI()
 llama = IntegrataLlama()
+metrics = ServiceMetrics(llama)
+
+# When set, every web search is traced and appended here as OTLP/JSON lines
+TRACE_FILE = os.getenv("INTEGRATA_TRACE_FILE")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time every request and track how many are in flight, per route template.
+
+    call_next() returns once the headers are sent, so a response is only
+    counted as finished when its body has been fully sent; for SSE and
+    NDJSON streams that is when the stream ends.
+    """
+    # Label by template rather than raw path so unknown URLs cannot grow the label set
+    route = "unmatched"
+    for candidate in app.router.routes:
+        if candidate.matches(request.scope)[0] == Match.FULL:
+            route = candidate.path
+            break
+    metrics.in_flight.inc(route=route)
+    started = time.perf_counter()
+
+    def finished(status):
+        metrics.in_flight.dec(route=route)
+        metrics.requests.observe(time.perf_counter() - started, route=route, method=request.method, status=status)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finished(500)
+        raise
+    body = response.body_iterator
+
+    async def observed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finished(response.status_code)
+
+    response.body_iterator = observed_body()
+    return response
 
 class ReasonRequest(BaseModel):
     input: str
     context: Optional[dict] = None
+    stream: Optional[bool] = False
+    action_timeout: Optional[float] = None
 
-def sequential_reasoning(user_input: str, context: Optional[dict] = None) -> Dict[str, Any]:
+def sse_response(deltas, first_event: Optional[dict] = None) -> StreamingResponse:
     """
-    Uses the actual LLaMA model (via IntegrataLlama) to deliberate and select the right tool or action.
-    For now, uses simple rules, but can be extended to use LLaMA for chain-of-thought.
+    Wrap an async iterator of text deltas as a Server-Sent Events response.
+
+    Each delta is sent as ``data: {"delta": ...}`` the moment it arrives, and the
+    stream ends with ``data: [DONE]``. Upstream errors are reported in-band.
     """
-    steps: List[str] = []
-    result = None
+    async def events():
+        if first_event is not None:
+            yield f"data: {json.dumps(first_event)}\n\n"
+        try:
+            async for text in deltas:
+                yield f"data: {json.dumps({'delta': text})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def request_trace(name: str, requested: Optional[bool]) -> Optional[Trace]:
+    """A Trace for this request if the caller asked for timings or traces are exported."""
+    if not requested and not TRACE_FILE:
+        return None
+    return Trace(name, include_in_results=bool(requested))
+
+def export_trace(trace: Optional[Trace]):
+    if trace is not None and TRACE_FILE:
+        trace.export(TRACE_FILE)
+
+async def exporting(trace: Optional[Trace], events):
+    """Pass ``events`` through and export the trace once the stream ends."""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        export_trace(trace)
+
+def ndjson_response(events) -> StreamingResponse:
+    """Stream an async iterator of JSON-serializable events as newline-delimited JSON."""
+    async def lines():
+        try:
+            async for event in events:
+                yield json.dumps(event, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+# Keyword rules for the router, in the order actions are listed in a plan
+INTENT_KEYWORDS = (
+    ("moderate", ("moderate", "safe")),
+    ("web_search", ("search", "web")),
+    ("weather", ("weather",)),
+)
+INTENT_STEPS = {
+    "moderate": "Detected moderation request. Calling moderate().",
+    "web_search": "Detected web search request. Calling web_search().",
+    "weather": "Detected weather tool call. Calling tool_call('get_weather').",
+}
+ACTIONS = {
+    "moderate": llama.async_moderate,
+    "web_search": llama.async_web_search,
+    "weather": lambda user_input: llama.async_tool_call("get_weather", user_input),
+}
+# Seconds each planned action may run before it is abandoned
+ACTION_TIMEOUT = float(os.getenv("INTEGRATA_ACTION_TIMEOUT", "60"))
+# "model" routes with the intent classifier; "keywords" only uses INTENT_KEYWORDS
+ROUTER = os.getenv("INTEGRATA_ROUTER", "model")
+
+def plan_intents(user_input: str) -> List[str]:
+    """Every action the input asks for, or ["chat"] if it asks for none."""
     lowered = user_input.lower()
-    if "moderate" in lowered or "safe" in lowered:
-        steps.append("Detected moderation request. Calling moderate().")
-        result = llama.moderate(user_input)
-    elif "search" in lowered or "web" in lowered:
-        steps.append("Detected web search request. Calling web_search().")
-        result = llama.web_search(user_input)
-    elif "weather" in lowered:
-        steps.append("Detected weather tool call. Calling tool_call('get_weather').")
-        result = llama.tool_call("get_weather", user_input)
-    else:
+    intents = [intent for intent, keywords in INTENT_KEYWORDS if any(k in lowered for k in keywords)]
+    return intents or ["chat"]
+
+async def run_plan(user_input: str, intents: List[str], steps: List[str], timeout: float) -> Dict[str, Any]:
+    """
+    Run the planned actions concurrently, each under ``timeout`` seconds.
+
+    A failed or timed-out action reports ``{"error": ...}`` in its slot. If
+    moderation flags the input, the actions still running are cancelled and
+    the results of the finished ones are withheld.
+    """
+    tasks = {asyncio.create_task(asyncio.wait_for(ACTIONS[intent](user_input), timeout)): intent for intent in intents}
+    results: Dict[str, Any] = {}
+    pending = set(tasks)
+    started = time.perf_counter()
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            intent = tasks[task]
+            metrics.actions.observe(time.perf_counter() - started, action=intent)
+            try:
+                results[intent] = task.result()
+                steps.append(f"{intent} finished.")
+            except asyncio.TimeoutError:
+                results[intent] = {"error": f"Timed out after {timeout:g}s"}
+                steps.append(f"{intent} timed out after {timeout:g}s.")
+            except Exception as e:
+                results[intent] = {"error": str(e)}
+                steps.append(f"{intent} failed: {e}")
+            if intent == "moderate" and is_flagged(results[intent]):
+                for other in pending:
+                    other.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                pending = set()
+                steps.append("Moderation flagged the input; cancelled or withheld the other actions.")
+                for other in intents:
+                    if other != "moderate":
+                        results[other] = {"error": "Withheld: input flagged by moderation"}
+                break
+    return {intent: results[intent] for intent in intents}
+
+async def route(user_input: str, steps: List[str]):
+    """
+    Pick the actions for ``user_input`` with the intent classifier, falling
+    back to the keyword rules if it fails or ROUTER is "keywords".
+    Returns ``(intents, source)``.
+    """
+    if ROUTER == "model":
+        try:
+            return await llama.async_classify_intents(user_input)
+        except Exception as e:
+            steps.append(f"Intent classifier failed ({type(e).__name__}); using keyword rules.")
+    return plan_intents(user_input), "keywords"
+
+async def sequential_reasoning(user_input: str, context: Optional[dict] = None, stream: bool = False,
+                               action_timeout: float = ACTION_TIMEOUT) -> Dict[str, Any]:
+    """
+    Route an input to the actions it asks for and run them.
+
+    The actions are picked by a small LLaMA model with structured output
+    (see IntegrataLlama.classify_intents()), whose answers are cached for
+    similar inputs. Independent actions (moderation, web search, tool calls)
+    run concurrently; with one action ``result`` is its result, with several
+    it maps each action to its result. Inputs that ask for none go to chat,
+    and when ``stream`` is set ``result`` is an async iterator of text deltas
+    instead of a finished response. ``timings`` reports routing and action
+    time separately.
+    """
+    steps: List[str] = []
+    started = time.perf_counter()
+    intents, routed_by = await route(user_input, steps)
+    routing = time.perf_counter() - started
+    metrics.routing.observe(routing, source=routed_by)
+    timings = {"routed_by": routed_by, "routing_ms": round(routing * 1000, 3)}
+    started = time.perf_counter()
+    if intents == ["chat"]:
         steps.append("Defaulting to chat().")
-        result = llama.chat(user_input)
-    return {"result": result, "reasoning_steps": steps}
+        if stream:
+            return {"result": llama.async_stream_chat(user_input), "reasoning_steps": steps, "timings": timings}
+        result = await llama.async_chat(user_input)
+    else:
+        steps.extend(INTENT_STEPS[intent] for intent in intents)
+        if len(intents) > 1:
+            steps.append(f"Running {', '.join(intents)} concurrently.")
+        results = await run_plan(user_input, intents, steps, action_timeout)
+        result = results[intents[0]] if len(intents) == 1 else results
+    timings["actions_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return {"result": result, "reasoning_steps": steps, "timings": timings}
 
 @app.post("/reason")
-def reason_endpoint(req: ReasonRequest):
-    output = sequential_reasoning(req.input, req.context)
+async def reason_endpoint(req: ReasonRequest):
+    output = await sequential_reasoning(req.input, req.context, stream=bool(req.stream),
+                                        action_timeout=req.action_timeout or ACTION_TIMEOUT)
+    if inspect.isasyncgen(output["result"]):
+        return sse_response(output["result"], {"reasoning_steps": output["reasoning_steps"], "timings": output["timings"]})
     return output
 
 class ChatRequest(BaseModel):
     message: str
     stream: Optional[bool] = False
+    use_cache: Optional[bool] = True
+    guarded: Optional[bool] = False
+
+class SessionCreateRequest(BaseModel):
+    system: Optional[str] = None
+    max_history_tokens: Optional[int] = HISTORY_TOKENS
+
+class SessionMessageRequest(BaseModel):
+    message: str
+    stream: Optional[bool] = False
 
 class ModerateRequest(BaseModel):
     content: str
 
+class ModerateBatchRequest(BaseModel):
+    contents: List[str]
+    concurrency: Optional[int] = 16
+    use_cache: Optional[bool] = True
+
 class WebSearchRequest(BaseModel):
     query: str
     max_results: Optional[int] = 8
+    concurrency: Optional[int] = 8
+    fetch_timeout: Optional[float] = 10
+    summary_timeout: Optional[float] = 60
+    use_cache: Optional[bool] = True
+    page_tokens: Optional[int] = PAGE_TOKENS
+    map_reduce: Optional[bool] = False
+    trace: Optional[bool] = False
+    stream: Optional[bool] = False
+
+class WebSearchBatchRequest(BaseModel):
+    queries: List[str]
+    max_results: Optional[int] = 8
+    concurrency: Optional[int] = 16
+    fetch_timeout: Optional[float] = 10
+    summary_timeout: Optional[float] = 60
+    use_cache: Optional[bool] = True
+    page_tokens: Optional[int] = PAGE_TOKENS
+    map_reduce: Optional[bool] = False
+    trace: Optional[bool] = False
+    stream: Optional[bool] = False
 
 class ToolCallRequest(BaseModel):
     tool_name: str
@@ -55,23 +289,118 @@ class ToolCallRequest(BaseModel):
     kwargs: Optional[dict] = {}
 
 @app.post("/chat")
-def chat_endpoint(req: ChatRequest):
-    stream = req.stream if req.stream is not None else False
-    return {"response": llama.chat(req.message, stream=stream)}
+async def chat_endpoint(req: ChatRequest):
+    if req.guarded:
+        # Moderation runs alongside generation rather than as a separate round trip first
+        if req.stream:
+            return sse_response(llama.async_guarded_stream_chat(req.message))
+        try:
+            return {"response": await llama.async_guarded_chat(req.message, use_cache=req.use_cache is not False)}
+        except ContentFlagged as e:
+            return {"response": None, "flagged": True, "flagged_categories": e.categories}
+    if req.stream:
+        return sse_response(llama.async_stream_chat(req.message))
+    return {"response": await llama.async_chat(req.message, use_cache=req.use_cache is not False)}
+
+@app.post("/chat/session")
+async def session_create_endpoint(req: SessionCreateRequest):
+    session = llama.create_session(req.system, req.max_history_tokens or HISTORY_TOKENS)
+    return {"session_id": session.session_id}
+
+def get_session(session_id: str):
+    session = llama.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session
+
+@app.post("/chat/session/{session_id}")
+async def session_message_endpoint(session_id: str, req: SessionMessageRequest):
+    session = get_session(session_id)
+    if req.stream:
+        # The turn itself starts when the body is streamed; reject a busy
+        # session now so both modes answer with the same status codes
+        if session.busy:
+            raise HTTPException(status_code=409, detail=f"session {session_id} is already answering a message")
+        return sse_response(llama.async_stream_session_chat(session_id, req.message))
+    try:
+        response = await llama.async_session_chat(session_id, req.message)
+    except SessionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"response": response, "history_tokens": session.history_tokens}
+
+@app.get("/chat/session/{session_id}")
+async def session_history_endpoint(session_id: str):
+    return get_session(session_id).to_dict()
+
+@app.delete("/chat/session/{session_id}")
+async def session_delete_endpoint(session_id: str):
+    get_session(session_id)
+    llama.sessions.delete(session_id)
+    return {"deleted": session_id}
 
 @app.post("/moderate")
-def moderate_endpoint(req: ModerateRequest):
-    return {"response": llama.moderate(req.content)}
+async def moderate_endpoint(req: ModerateRequest):
+    return {"response": await llama.async_moderate(req.content)}
+
+@app.post("/moderate/batch")
+async def moderate_batch_endpoint(req: ModerateBatchRequest):
+    results = await llama.async_moderate_many(
+        req.contents, concurrency=req.concurrency or 16, use_cache=req.use_cache is not False
+    )
+    return {"response": [{"error": str(r)} if isinstance(r, Exception) else r for r in results]}
 
 @app.post("/web_search")
-def web_search_endpoint(req: WebSearchRequest):
-    max_results = req.max_results if req.max_results is not None else 8
-    return {"response": llama.web_search(req.query, max_results=max_results)}
+async def web_search_endpoint(req: WebSearchRequest):
+    options = dict(
+        max_results=req.max_results if req.max_results is not None else 8,
+        concurrency=req.concurrency or 8,
+        fetch_timeout=req.fetch_timeout or 10,
+        summary_timeout=req.summary_timeout or 60,
+        use_cache=req.use_cache is not False,
+        page_tokens=req.page_tokens or PAGE_TOKENS,
+        map_reduce=bool(req.map_reduce),
+    )
+    trace = request_trace("web_search", req.trace)
+    if req.stream:
+        return ndjson_response(exporting(trace, llama.async_web_search_stream(req.query, trace=trace, **options)))
+    response = await llama.async_web_search(req.query, trace=trace, **options)
+    export_trace(trace)
+    if req.trace:
+        return {"response": response, "trace": trace.timings()}
+    return {"response": response}
+
+@app.post("/web_search/batch")
+async def web_search_batch_endpoint(req: WebSearchBatchRequest):
+    options = dict(
+        max_results=req.max_results if req.max_results is not None else 8,
+        concurrency=req.concurrency or 16,
+        fetch_timeout=req.fetch_timeout or 10,
+        summary_timeout=req.summary_timeout or 60,
+        use_cache=req.use_cache is not False,
+        page_tokens=req.page_tokens or PAGE_TOKENS,
+        map_reduce=bool(req.map_reduce),
+    )
+    trace = request_trace("web_search_batch", req.trace)
+    if req.stream:
+        return ndjson_response(exporting(trace, llama.async_web_search_many_stream(req.queries, trace=trace, **options)))
+    response = await llama.async_web_search_many(req.queries, trace=trace, **options)
+    export_trace(trace)
+    if req.trace:
+        return {"response": response, "trace": trace.timings()}
+    return {"response": response}
 
 @app.post("/tool_call")
-def tool_call_endpoint(req: ToolCallRequest):
-    return {"response": llama.tool_call(req.tool_name, *(req.args or []), **(req.kwargs or {}))}
+async def tool_call_endpoint(req: ToolCallRequest):
+    return {"response": await llama.async_tool_call(req.tool_name, *(req.args or []), **(req.kwargs or {}))}
+
+@app.get("/stats")
+async def stats_endpoint():
+    return {"coalesced_calls": llama.coalesced_calls, "models": llama.usage_stats()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "IntegrataLlama API is running."}
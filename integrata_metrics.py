@@ -0,0 +1,326 @@
+"""
+Prometheus-style metrics for the IntegrataLlama service.
+
+Metrics are kept as fixed-size counters and bucketed histograms, so memory
+depends on the number of label combinations and not on uptime, and are
+rendered in the Prometheus text exposition format.
+"""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits up to slow multi-page summaries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, values, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Counter incremented directly, or read from ``fn`` at render time. ``fn``
+    returns a number for an unlabelled metric or ``{label values tuple: number}``.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        if self.fn is not None:
+            values = self.fn()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [("", key, "", value) for key, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed ``buckets`` (upper bounds, in seconds)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one slot per bucket, then the sum of observations
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", key, f'le="{_number(bound)}"', cumulative))
+            samples.append(("_sum", key, "", counts[-1]))
+            samples.append(("_count", key, "", cumulative))
+        return samples
+
+
+class QuantileSketch:
+    """
+    Constant-memory quantile estimates over a stream of positive values.
+
+    Values are counted in logarithmic buckets (as in DDSketch/HDR histograms),
+    so any quantile is reported within ``relative_accuracy`` of the true value.
+    Values outside ``[min_value, max_value]`` are clamped into the edge
+    buckets. add() is O(1); quantile() walks a fixed number of buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-4, max_value: float = 1e4):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self._offset = math.ceil(math.log(min_value) / self._log_gamma)
+        self._counts: List[int] = [0] * (self._index(max_value) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma) - self._offset
+
+    def add(self, value: float):
+        index = self._index(max(value, self.min_value))
+        self._counts[min(index, len(self._counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile (0..1); 0 when nothing was added."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen > rank:
+                # midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return 2 * self.gamma ** (index + self._offset) / (self.gamma + 1)
+        return self.gamma ** (len(self._counts) - 1 + self._offset)
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class RollingRate:
+    """Events per second over the last ``window`` seconds, kept in one-second slots."""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._slots = [0] * window
+        self._stamps = [-1] * window
+
+    def add(self, count: int = 1, now: Optional[float] = None):
+        second = int(time.time() if now is None else now)
+        slot = second % self.window
+        if self._stamps[slot] != second:
+            self._stamps[slot] = second
+            self._slots[slot] = 0
+        self._slots[slot] += count
+
+    def rate(self, now: Optional[float] = None) -> float:
+        second = int(time.time() if now is None else now)
+        recent = sum(c for c, stamp in zip(self._slots, self._stamps) if second - stamp < self.window)
+        return recent / self.window
+
+
+class OutcomeCounter:
+    """
+    Mixin that counts yes/no outcomes (cache hits and misses, page downloads
+    that worked or failed) in the two attributes named by ``outcome_names``
+    and passes each outcome to the registered callbacks.
+    """
+
+    outcome_names = ("hits", "misses")
+
+    def __init__(self):
+        self.callbacks: List[Callable[[bool], None]] = []
+        for name in self.outcome_names:
+            setattr(self, name, 0)
+
+    def register_callback(self, callback: Callable[[bool], None]):
+        """Register ``callback(outcome)``, called once per recorded outcome."""
+        self.callbacks.append(callback)
+
+    def record(self, outcome: bool):
+        name = self.outcome_names[0 if outcome else 1]
+        setattr(self, name, getattr(self, name) + 1)
+        for cb in self.callbacks:
+            cb(outcome)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None) -> Counter:
+        return self.register(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+def _ratio(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+class ServiceMetrics:
+    """
+    The metrics exported by the API service for one IntegrataLlama instance.
+
+    Route latency, in-flight requests and /reason routing and action time
+    are recorded by the caller (the FastAPI app); upstream latency and errors come from the
+    RateLimiter, token counts from the UsageTracker, and cache and page-fetch
+    outcomes from the callbacks of the caches and fetchers.
+    """
+
+    def __init__(self, llama, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        r = self.registry
+        self.requests = r.histogram(
+            "integrata_http_request_duration_seconds", "Time to respond to an API request.",
+            ("route", "method", "status"),
+        )
+        self.in_flight = r.gauge("integrata_http_requests_in_flight", "API requests being handled.", ("route",))
+        self.upstream = r.histogram(
+            "integrata_upstream_duration_seconds",
+            "Duration of each Llama API attempt (time to the first response for streams).", ("model",),
+        )
+        self.upstream_errors = r.counter(
+            "integrata_upstream_errors_total", "Failed Llama API attempts by HTTP status or error type.",
+            ("model", "status"),
+        )
+        self.tokens = r.counter("integrata_upstream_tokens_total", "Tokens used by Llama API calls.", ("model", "kind"))
+        self.routing = r.histogram(
+            "integrata_routing_duration_seconds", "Time to pick the actions for a /reason request.", ("source",)
+        )
+        self.actions = r.histogram(
+            "integrata_action_duration_seconds", "Time for each planned /reason action to finish.", ("action",)
+        )
+        limiter = llama.rate_limiter
+        r.gauge("integrata_upstream_in_flight", "Llama API calls in flight.",
+                fn=lambda: limiter.concurrency.in_flight)
+        r.gauge("integrata_upstream_concurrency_limit", "Current adaptive concurrency window for Llama API calls.",
+                fn=lambda: limiter.concurrency.limit)
+        r.counter("integrata_upstream_coalesced_total", "Llama API calls served by an identical call in flight.",
+                  fn=lambda: llama.coalesced_calls)
+
+        caches = {
+            "page": llama.page_cache, "completion": llama.completion_cache,
+            "moderation": llama.moderation_cache, "search": llama.search_cache, "intent": llama.intent_cache,
+        }
+        self.cache_lookups = r.counter("integrata_cache_lookups_total", "Cache lookups by result.", ("cache", "result"))
+        r.gauge("integrata_cache_hit_ratio", "Fraction of cache lookups that were hits.", ("cache",),
+                fn=lambda: {(name,): _ratio(c.hits, c.misses) for name, c in caches.items()})
+        for name, cache in caches.items():
+            cache.register_callback(
+                lambda hit, name=name: self.cache_lookups.inc(cache=name, result="hit" if hit else "miss")
+            )
+
+        fetchers = {"sync": llama.fetcher, "async": llama.async_fetcher}
+        self.page_fetches = r.counter("integrata_page_fetches_total", "Page downloads by outcome.", ("outcome",))
+        r.gauge("integrata_page_fetch_success_ratio", "Fraction of page downloads that produced text.",
+                fn=lambda: _ratio(sum(f.fetched for f in fetchers.values()), sum(f.failed for f in fetchers.values())))
+        for fetcher in fetchers.values():
+            fetcher.register_callback(
+                lambda ok: self.page_fetches.inc(outcome="success" if ok else "failure")
+            )
+
+        limiter.register_callback(self._upstream_attempt)
+        llama.usage.register_callback(self._usage)
+
+    def _upstream_attempt(self, model, seconds, error):
+        self.upstream.observe(seconds, model=model)
+        if error is not None:
+            self.upstream_errors.inc(model=model, status=getattr(error, "status_code", None) or type(error).__name__)
+
+    def _usage(self, model, usage):
+        self.tokens.inc(usage["prompt_tokens"], model=model, kind="prompt")
+        self.tokens.inc(usage["completion_tokens"], model=model, kind="completion")
+
+    def render(self) -> str:
+        return self.registry.render()
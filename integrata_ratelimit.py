@@ -0,0 +1,331 @@
+"""
+Rate limiting, retry and adaptive concurrency for Llama API calls.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from llama_api_client import APIConnectionError, APIStatusError, APITimeoutError
+
+from integrata_cache import CompletionCache
+from integrata_concurrency import AsyncSingleFlight, SingleFlight, Slots
+from integrata_tokens import UsageTracker
+from integrata_trace import span
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at ``per_minute`` tokens per minute.
+
+    reserve() always succeeds and returns how long the caller has to wait
+    before using what it took, so waiting callers queue up in arrival order
+    without polling.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        """Return tokens that were reserved but not used (negative to charge more)."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AIMDLimiter(Slots):
+    """
+    Concurrency limit with additive increase / multiplicative decrease.
+
+    Every successful call grows the limit by ``increase`` per window of calls;
+    every throttled call multiplies it by ``decrease``. The limit stays within
+    ``[minimum, maximum]``.
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64,
+                 increase: float = 1.0, decrease: float = 0.5):
+        super().__init__(float(initial))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+
+    def release(self, throttled: bool = False, completed: bool = True):
+        """
+        Free a slot. A throttled call shrinks the limit and a completed one
+        grows it; an abandoned call (``completed=False``) leaves it as is.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            elif completed:
+                self.limit = min(self.maximum, self.limit + self.increase / max(self.limit, 1.0))
+            self._wake()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    # A timeout is the caller's deadline for the whole call, not a transient failure
+    return isinstance(error, APIConnectionError) and not isinstance(error, APITimeoutError)
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _estimate_tokens(params: dict) -> int:
+    """Rough upper bound of the tokens a call will consume, for the token bucket."""
+    prompt = len(json.dumps(params.get("messages", []), default=str)) // 4
+    return prompt + int(params.get("max_completion_tokens") or 0)
+
+
+def _used_tokens(response) -> Optional[int]:
+    for metric in getattr(response, "metrics", None) or []:
+        if metric.metric == "num_total_tokens":
+            return int(metric.value)
+    return None
+
+
+class RateLimiter:
+    """
+    Shared admission policy for every call made through a rate-limited client.
+
+    Calls wait for a request token (``requests_per_minute``), for their
+    estimated tokens (``tokens_per_minute``) and for a slot in the AIMD
+    concurrency window. 429 and 5xx responses and connection errors are
+    retried up to ``max_retries`` times with full-jitter exponential backoff,
+    honouring Retry-After; a 429 also halves the concurrency window. Timeouts
+    are not retried: a call's ``timeout`` is the caller's deadline.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 initial_concurrency: int = 8, max_concurrency: int = 64, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 30.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AIMDLimiter(initial=initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+        self.callbacks = []
+
+    def register_callback(self, callback: Callable[[str, float, Optional[Exception]], None]):
+        """
+        Register ``callback(model, seconds, error)``, called after every
+        upstream attempt; ``error`` is None when the attempt succeeded.
+        """
+        self.callbacks.append(callback)
+
+    def _attempted(self, params: dict, started: float, error: Optional[Exception] = None):
+        model = params.get("model") or "default"
+        for cb in self.callbacks:
+            cb(model, time.monotonic() - started, error)
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Build a limiter from LLAMA_REQUESTS_PER_MINUTE / LLAMA_TOKENS_PER_MINUTE."""
+        rpm = os.getenv("LLAMA_REQUESTS_PER_MINUTE")
+        tpm = os.getenv("LLAMA_TOKENS_PER_MINUTE")
+        return cls(requests_per_minute=float(rpm) if rpm else None, tokens_per_minute=float(tpm) if tpm else None)
+
+    def _admission_delay(self, estimate: int) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(estimate))
+        return delay
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return max(delay, _retry_after(error))
+
+    def _settle(self, estimate: int, response):
+        used = _used_tokens(response)
+        if self.tokens is not None and used is not None:
+            self.tokens.refund(estimate - used)
+
+    def _failed(self, error: Exception, attempt: int) -> bool:
+        """Record a failed attempt; True if it should be retried."""
+        throttled = isinstance(error, APIStatusError) and error.status_code == 429
+        self.concurrency.release(throttled=throttled)
+        if throttled:
+            self.throttled += 1
+        if attempt >= self.max_retries or not _is_retryable(error):
+            return False
+        self.retries += 1
+        return True
+
+    def call(self, fn: Callable[..., Any], **params) -> Any:
+        return self.call_timed(fn, **params)[0]
+
+    def call_timed(self, fn: Callable[..., Any], **params) -> Tuple[Any, float]:
+        """
+        Like call(), but return ``(response, started)`` where ``started`` is
+        the time.monotonic() at which the successful attempt was sent, so
+        admission waits, queueing and retry backoff are left out of timings.
+        """
+        estimate = _estimate_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._admission_delay(estimate))
+            self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                response = fn(**params)
+            except Exception as e:
+                self._attempted(params, started, e)
+                if not self._failed(e, attempt):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException:
+                self.concurrency.release(completed=False)
+                raise
+            self._attempted(params, started)
+            self.concurrency.release()
+            self._settle(estimate, response)
+            return response, started
+
+    async def async_call(self, fn: Callable[..., Any], **params) -> Any:
+        return (await self.async_call_timed(fn, **params))[0]
+
+    async def async_call_timed(self, fn: Callable[..., Any], **params) -> Tuple[Any, float]:
+        """Async version of call_timed()."""
+        estimate = _estimate_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._admission_delay(estimate))
+            await self.concurrency.async_acquire()
+            started = time.monotonic()
+            try:
+                response = await fn(**params)
+            except Exception as e:
+                self._attempted(params, started, e)
+                if not self._failed(e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException:
+                # Cancelled (e.g. the client went away): give the slot back
+                self.concurrency.release(completed=False)
+                raise
+            self._attempted(params, started)
+            self.concurrency.release()
+            self._settle(estimate, response)
+            return response, started
+
+
+class _Endpoint:
+    _flight_class = SingleFlight
+
+    def __init__(self, create, limiter: RateLimiter, usage: Optional[UsageTracker] = None, name: str = "create"):
+        self._create = create
+        self.name = name
+        self._limiter = limiter
+        self._usage = usage
+        self._flight = self._flight_class()
+
+    @property
+    def coalesced(self) -> int:
+        return self._flight.coalesced
+
+    def _call(self, **params):
+        with span(self.name, model=params.get("model") or "default"):
+            response, started = self._limiter.call_timed(self._create, **params)
+        if self._usage is None:
+            return response
+        model, messages = params.get("model"), params.get("messages")
+        if params.get("stream"):
+            return self._usage.track_stream(response, model, messages, started)
+        self._usage.record_response(model, messages, response, time.monotonic() - started)
+        return response
+
+    def create(self, **params):
+        if params.get("stream"):
+            return self._call(**params)
+        return self._flight.do(CompletionCache.key(**params), self._call, **params)
+
+
+class _AsyncEndpoint(_Endpoint):
+    _flight_class = AsyncSingleFlight
+
+    async def _call(self, **params):
+        with span(self.name, model=params.get("model") or "default"):
+            response, started = await self._limiter.async_call_timed(self._create, **params)
+        if self._usage is None:
+            return response
+        model, messages = params.get("model"), params.get("messages")
+        if params.get("stream"):
+            return self._usage.track_async_stream(response, model, messages, started)
+        self._usage.record_response(model, messages, response, time.monotonic() - started)
+        return response
+
+    async def create(self, **params):
+        if params.get("stream"):
+            return await self._call(**params)
+        return await self._flight.do(CompletionCache.key(**params), self._call, **params)
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class RateLimitedLlamaClient:
+    """
+    Drop-in wrapper for LlamaAPIClient whose ``chat.completions.create`` and
+    ``moderations.create`` go through a RateLimiter. The SDK's own retries are
+    disabled so backoff is handled in one place; other attributes pass through.
+
+    Identical non-streaming calls that are in flight at the same time (same
+    model, messages and parameters) share a single upstream request;
+    ``coalesced`` counts the calls answered that way. With a ``usage``
+    tracker, every chat completion that reaches the API (streamed or not) is
+    recorded there; coalesced calls are not counted twice.
+    """
+
+    _endpoint = _Endpoint
+
+    def __init__(self, client, limiter: Optional[RateLimiter] = None, usage: Optional[UsageTracker] = None):
+        self._client = client.with_options(max_retries=0)
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.usage = usage
+        self.chat = _Chat(self._endpoint(
+            self._client.chat.completions.create, self.limiter, usage, name="chat.completions.create"
+        ))
+        self.moderations = self._endpoint(self._client.moderations.create, self.limiter, name="moderations.create")
+
+    @property
+    def coalesced(self) -> int:
+        return self.chat.completions.coalesced + self.moderations.coalesced
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class AsyncRateLimitedLlamaClient(RateLimitedLlamaClient):
+    """Async version of RateLimitedLlamaClient for AsyncLlamaAPIClient."""
+
+    _endpoint = _AsyncEndpoint
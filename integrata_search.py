@@ -0,0 +1,46 @@
+"""
+Client, caches and page fetcher shared by the standalone web search scripts.
+"""
+
+import os
+from typing import Optional
+
+from ddgs import DDGS
+from llama_api_client import AsyncLlamaAPIClient
+
+from integrata_cache import CompletionCache, PageCache, SearchCache
+from integrata_extract import ExtractionPool
+from integrata_fetch import AsyncPageFetcher
+from integrata_ratelimit import AsyncRateLimitedLlamaClient, RateLimiter
+from integrata_tokens import UsageTracker
+
+
+class SearchStack:
+    """
+    Everything a script needs to search DuckDuckGo and summarize the hits:
+    a rate-limited async Llama client (retried on 429/5xx, token counts
+    tallied in ``usage`` when one is given), a persistent page cache behind a
+    pooled non-blocking fetcher whose readability runs in worker processes, a
+    completion cache for repeated summary prompts, and a short-lived cache of
+    DuckDuckGo results for repeated and drill-down queries.
+    """
+
+    def __init__(self, api_key: str, usage: Optional[UsageTracker] = None):
+        self.client = AsyncRateLimitedLlamaClient(AsyncLlamaAPIClient(api_key=api_key), RateLimiter.from_env(), usage)
+        self.page_cache = PageCache()
+        self.extractor = ExtractionPool()
+        self.fetcher = AsyncPageFetcher(cache=self.page_cache, extractor=self.extractor)
+        self.completion_cache = CompletionCache()
+        self.search_cache = SearchCache()
+
+    @classmethod
+    def from_env(cls, usage: Optional[UsageTracker] = None) -> "SearchStack":
+        """Build a stack for the key in ``LLAMA_API_KEY``."""
+        api_key = os.getenv("LLAMA_API_KEY")
+        if not api_key or api_key == "YOUR_API_KEY_HERE":
+            raise RuntimeError("Please set your LLAMA_API_KEY environment variable.")
+        return cls(api_key, usage)
+
+    def web_search(self, query: str, max_results: int = 10):
+        """DuckDuckGo results for ``query``, reused while they are fresh."""
+        return self.search_cache.get_or_search(query, max_results, lambda q, n: list(DDGS().text(q, max_results=n)))
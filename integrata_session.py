@@ -0,0 +1,198 @@
+"""
+Server-side chat sessions with bounded history.
+
+A session keeps the conversation as plain ``{"role", "content"}`` messages so
+clients only send the new message each turn. Once the history passes a token
+budget, the oldest turns are folded into a running summary (or dropped when
+no summary can be made), which keeps prompt tokens bounded however long the
+conversation runs. Compaction folds enough turns to bring the verbatim
+history down to half the budget, so it runs every few turns rather than on
+every turn once the budget is reached, and it can run in the background
+while the session takes its next turn.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from integrata_tokens import count_tokens
+
+# Default token budget for a session's history (summary plus verbatim turns)
+HISTORY_TOKENS = 3000
+# Most recent user/assistant exchanges always kept verbatim
+KEEP_TURNS = 1
+
+# Per-message framing, as counted by count_message_tokens()
+_MESSAGE_OVERHEAD = 4
+
+
+class SessionBusy(RuntimeError):
+    """Raised when a turn is started on a session that is already answering one."""
+
+
+class ChatSession:
+    """
+    One conversation: an optional system prompt, a summary of folded turns,
+    and the recent turns verbatim.
+
+    Turns are taken one at a time; begin_turn() raises SessionBusy while
+    another turn on the same session is in flight, so history never interleaves.
+    At most one compaction runs at a time (start_compaction() to
+    end_compaction()); turns keep being taken while it runs, and fold() only
+    removes turns from the front, so exchanges added meanwhile are kept.
+    """
+
+    def __init__(self, session_id: str, system: Optional[str] = None,
+                 max_history_tokens: int = HISTORY_TOKENS, keep_turns: int = KEEP_TURNS):
+        self.session_id = session_id
+        self.system = system
+        self.max_history_tokens = max_history_tokens
+        self.keep_turns = keep_turns
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.compactions = 0
+        self.updated = time.time()
+        self._tokens: List[int] = []
+        self._busy = False
+        self._compacting = False
+        self._lock = threading.Lock()
+
+    @property
+    def history_tokens(self) -> int:
+        """Approximate tokens of the summary plus the verbatim turns."""
+        summary = count_tokens(self.summary) + _MESSAGE_OVERHEAD if self.summary else 0
+        return summary + sum(self._tokens)
+
+    @property
+    def busy(self) -> bool:
+        """True while a turn is being answered."""
+        return self._busy
+
+    def begin_turn(self):
+        with self._lock:
+            if self._busy:
+                raise SessionBusy(f"session {self.session_id} is already answering a message")
+            self._busy = True
+            self.updated = time.time()
+
+    def end_turn(self):
+        with self._lock:
+            self._busy = False
+            self.updated = time.time()
+
+    def messages(self, message: str) -> List[Dict[str, str]]:
+        """The prompt for a turn: system prompt, summary, recent turns and ``message``."""
+        messages = []
+        if self.system:
+            messages.append({"role": "system", "content": self.system})
+        with self._lock:
+            if self.summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+            messages.extend(self.turns)
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def add_exchange(self, message: str, reply: str):
+        """Record a completed turn."""
+        tokens = [count_tokens(content) + _MESSAGE_OVERHEAD for content in (message, reply)]
+        with self._lock:
+            self.turns += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+            self._tokens += tokens
+
+    def needs_compaction(self) -> bool:
+        return self.history_tokens > self.max_history_tokens and len(self.turns) > 2 * self.keep_turns
+
+    def oldest_turns(self) -> List[Dict[str, str]]:
+        """
+        The turns compaction would fold: the oldest exchanges, until the rest
+        fit in half of ``max_history_tokens``. The last ``keep_turns``
+        exchanges are always kept.
+        """
+        foldable = len(self.turns) - 2 * self.keep_turns
+        kept = sum(self._tokens)
+        count = 0
+        while count < foldable and kept > self.max_history_tokens // 2:
+            kept -= self._tokens[count] + self._tokens[count + 1]
+            count += 2
+        return self.turns[:count]
+
+    def start_compaction(self) -> Optional[List[Dict[str, str]]]:
+        """
+        Claim the session's compaction and return the turns to fold, or None
+        if the history is within budget or another compaction is running.
+        A successful claim must be followed by end_compaction().
+        """
+        with self._lock:
+            if self._compacting or not self.needs_compaction():
+                return None
+            self._compacting = True
+            return self.oldest_turns()
+
+    def end_compaction(self):
+        with self._lock:
+            self._compacting = False
+
+    def fold(self, count: int, summary: Optional[str]):
+        """
+        Replace the first ``count`` turns with ``summary``; with no summary
+        they are dropped and the previous summary is kept.
+        """
+        with self._lock:
+            del self.turns[:count]
+            del self._tokens[:count]
+            if summary:
+                self.summary = summary
+            self.compactions += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "system": self.system,
+            "summary": self.summary,
+            "turns": list(self.turns),
+            "history_tokens": self.history_tokens,
+            "compactions": self.compactions,
+        }
+
+
+class SessionStore:
+    """
+    In-memory sessions by id. Sessions idle for ``ttl`` seconds expire and at
+    most ``max_sessions`` are kept, evicting the least recently used.
+    """
+
+    def __init__(self, ttl: float = 60 * 60, max_sessions: int = 1024):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, system: Optional[str] = None, max_history_tokens: int = HISTORY_TOKENS,
+               keep_turns: int = KEEP_TURNS) -> ChatSession:
+        session = ChatSession(os.urandom(16).hex(), system, max_history_tokens, keep_turns)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """The session, or None if it does not exist or has expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.updated >= self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
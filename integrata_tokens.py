@@ -0,0 +1,243 @@
+"""
+Token counting and per-model usage and cost accounting for Llama API calls.
+"""
+
+import functools
+import itertools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Used only when a response carries no token metrics
+_ENCODING = "cl100k_base"
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(_ENCODING)
+    except Exception:
+        return None
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """
+    Count the tokens in ``text`` with a cached tiktoken encoding.
+
+    Llama's own tokenizer is not public, so this is an approximation; without
+    tiktoken it falls back to four characters per token.
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _split_tokens_hard(text: str, max_tokens: int) -> List[str]:
+    """Cut ``text`` into pieces of at most ``max_tokens`` tokens, ignoring structure."""
+    encoding = _encoding()
+    if encoding is None:
+        step = max_tokens * 4
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    ids = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(ids[i:i + max_tokens]) for i in range(0, len(ids), max_tokens)]
+
+
+def _paragraph_pieces(paragraph: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """
+    Yield ``(piece, tokens)`` for one paragraph: the paragraph itself, or
+    pieces of ``max_tokens`` if it is longer than that. The paragraph is
+    encoded once.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        pieces = [paragraph] if count_tokens(paragraph) < max_tokens else _split_tokens_hard(paragraph, max_tokens)
+        for piece in pieces:
+            yield piece, count_tokens(piece)
+        return
+    ids = encoding.encode(paragraph, disallowed_special=())
+    if len(ids) < max_tokens:
+        yield paragraph, len(ids)
+        return
+    for i in range(0, len(ids), max_tokens):
+        piece = ids[i:i + max_tokens]
+        yield encoding.decode(piece), len(piece)
+
+
+def _token_chunks(text: str, max_tokens: int) -> Iterator[str]:
+    """split_tokens() as a generator, so callers that need only the first chunks stop early."""
+    current, size = [], 0
+    for paragraph in (text or "").split("\n"):
+        for piece, tokens in _paragraph_pieces(paragraph, max_tokens):
+            tokens += 1  # plus the newline joining it to the chunk
+            if current and size + tokens > max_tokens:
+                yield "\n".join(current)
+                current, size = [], 0
+            current.append(piece)
+            size += tokens
+    if current and any(current):
+        yield "\n".join(current)
+
+
+def split_tokens(text: str, max_tokens: int, max_chunks: Optional[int] = None) -> List[str]:
+    """
+    Split ``text`` into chunks of at most ``max_tokens`` tokens, stopping
+    after ``max_chunks`` chunks when given.
+
+    Chunks are packed from whole paragraphs (lines) so sentences are not cut
+    in half; only a paragraph that is longer than a chunk on its own is split
+    mid-text.
+    """
+    return list(itertools.islice(_token_chunks(text, max_tokens), max_chunks))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Keep the leading paragraphs of ``text`` that fit in ``max_tokens`` tokens."""
+    return next(_token_chunks(text, max_tokens), "")
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return ""
+
+
+def count_message_tokens(messages: List[dict]) -> int:
+    """Approximate prompt tokens of a chat ``messages`` list, with per-message framing."""
+    return sum(count_tokens(_content_text(m.get("content"))) + 4 for m in messages or [])
+
+
+def response_usage(metrics) -> Optional[Dict[str, int]]:
+    """
+    Read num_prompt_tokens/num_completion_tokens/num_total_tokens from the
+    ``metrics`` of a response or stream event; None if they are absent.
+    """
+    values = {m.metric: int(m.value) for m in metrics or []}
+    if "num_prompt_tokens" not in values and "num_completion_tokens" not in values:
+        return None
+    prompt = values.get("num_prompt_tokens", 0)
+    completion = values.get("num_completion_tokens", 0)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": values.get("num_total_tokens", prompt + completion),
+    }
+
+
+def _completion_text(response) -> str:
+    content = getattr(getattr(response, "completion_message", None), "content", None)
+    return content if isinstance(content, str) else getattr(content, "text", None) or ""
+
+
+def _env_price(name: str) -> float:
+    value = os.getenv(name)
+    return float(value) if value else 0.0
+
+
+class UsageTracker:
+    """
+    Aggregates token usage, generation time and cost per model.
+
+    Counts come from the response ``metrics`` when the API reports them and
+    from count_tokens() otherwise (``estimated_calls`` says how often that
+    happened). ``prices`` maps a model to its (input, output) price in dollars
+    per million tokens; models not listed use LLAMA_PRICE_INPUT_PER_MTOK and
+    LLAMA_PRICE_OUTPUT_PER_MTOK, which default to 0.
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.prices = dict(prices or {})
+        self.default_price = (_env_price("LLAMA_PRICE_INPUT_PER_MTOK"), _env_price("LLAMA_PRICE_OUTPUT_PER_MTOK"))
+        self.callbacks: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def register_callback(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """Register ``callback(model, usage)``, called once per recorded call."""
+        self.callbacks.append(callback)
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        input_price, output_price = self.prices.get(model, self.default_price)
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, seconds: float,
+               estimated: bool = False) -> Dict[str, Any]:
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "seconds": seconds,
+            "cost": self.cost(model, prompt_tokens, completion_tokens),
+            "estimated": estimated,
+        }
+        with self._lock:
+            stats = self._models.setdefault(model, {
+                "calls": 0, "estimated_calls": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "seconds": 0.0, "cost": 0.0,
+            })
+            stats["calls"] += 1
+            stats["estimated_calls"] += int(estimated)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["seconds"] += seconds
+            stats["cost"] += usage["cost"]
+        for cb in self.callbacks:
+            cb(model, usage)
+        return usage
+
+    def record_response(self, model: str, messages: List[dict], response, seconds: float) -> Dict[str, Any]:
+        """Record a non-streaming chat completion."""
+        usage = response_usage(getattr(response, "metrics", None))
+        if usage is not None:
+            return self.record(model, usage["prompt_tokens"], usage["completion_tokens"], seconds)
+        return self.record(model, count_message_tokens(messages), count_tokens(_completion_text(response)),
+                           seconds, estimated=True)
+
+    def _record_stream(self, model, messages, usage, parts, started):
+        seconds = time.monotonic() - started
+        if usage is not None:
+            self.record(model, usage["prompt_tokens"], usage["completion_tokens"], seconds)
+        else:
+            self.record(model, count_message_tokens(messages), count_tokens("".join(parts)), seconds, estimated=True)
+
+    def track_stream(self, stream, model: str, messages: List[dict], started: float):
+        """Pass a chat completion stream through, recording its usage when it ends."""
+        usage, parts = None, []
+        try:
+            for chunk in stream:
+                usage = response_usage(chunk.event.metrics) or usage
+                parts.append(getattr(chunk.event.delta, "text", None) or "")
+                yield chunk
+        finally:
+            self._record_stream(model, messages, usage, parts, started)
+
+    async def track_async_stream(self, stream, model: str, messages: List[dict], started: float):
+        """Async version of track_stream()."""
+        usage, parts = None, []
+        try:
+            async for chunk in stream:
+                usage = response_usage(chunk.event.metrics) or usage
+                parts.append(getattr(chunk.event.delta, "text", None) or "")
+                yield chunk
+        finally:
+            self._record_stream(model, messages, usage, parts, started)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model totals plus completion tokens/sec and average cost per call."""
+        with self._lock:
+            models = {model: dict(stats) for model, stats in self._models.items()}
+        for stats in models.values():
+            stats["total_tokens"] = stats["prompt_tokens"] + stats["completion_tokens"]
+            stats["tokens_per_second"] = stats["completion_tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+            stats["cost_per_call"] = stats["cost"] / stats["calls"]
+        return models
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
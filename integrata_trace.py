@@ -0,0 +1,206 @@
+"""
+Lightweight span tracing for the web search pipeline.
+
+Spans are only recorded while a Trace is active in the current context (see
+Trace.activate()); otherwise span() returns a shared no-op, so instrumented
+code costs one context-variable lookup per span. Traces can be read back as
+per-stage timings or exported as OpenTelemetry (OTLP/JSON) lines.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# (trace, parent span id) for the code running in this context, or None
+_current: contextvars.ContextVar = contextvars.ContextVar("integrata_trace", default=None)
+
+SERVICE_NAME = "integrata-llama"
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class _NoopSpan:
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def attach_timings(self, result):
+        return result
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    recording = True
+
+    def __init__(self, trace: "Trace", parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.parent_id = parent_id
+        self.span_id = os.urandom(8).hex()
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current.set((self.trace, self.span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.trace._finish(self)
+        return False
+
+    def set(self, **attributes):
+        """Add attributes that are only known once the stage has run."""
+        self.attributes.update(attributes)
+
+    def attach_timings(self, result):
+        """Add this span's stage timings to ``result`` if the trace asks for them."""
+        if self.trace.include_in_results and isinstance(result, dict):
+            result["timings"] = self.trace.timings(self.span_id)
+        return result
+
+
+def span(name: str, **attributes) -> Any:
+    """Context manager timing one stage; a no-op unless a Trace is active."""
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    return Span(current[0], current[1], name, attributes)
+
+
+class Trace:
+    """
+    Collects the spans of one traced operation.
+
+    With ``include_in_results``, instrumented per-result stages attach their
+    timings to the result dicts they return.
+    """
+
+    def __init__(self, name: str = "web_search", include_in_results: bool = True):
+        self.name = name
+        self.include_in_results = include_in_results
+        self.trace_id = os.urandom(16).hex()
+        self.start_ns = time.time_ns()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def activate(self) -> "_Activation":
+        """Make this the active trace for code run in (or spawned from) the current context."""
+        return _Activation(self)
+
+    def _finish(self, finished: Span):
+        with self._lock:
+            self.spans.append(finished)
+
+    def _timing(self, s: Span) -> Dict[str, Any]:
+        timing = {
+            "name": s.name,
+            "start_ms": round((s.start_ns - self.start_ns) / 1e6, 3),
+            "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 3),
+        }
+        if s.attributes:
+            timing["attributes"] = dict(s.attributes)
+        if s.error:
+            timing["error"] = s.error
+        return timing
+
+    def timings(self, root_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Finished spans as ``{"name", "start_ms", "duration_ms", ...}`` dicts in
+        start order; with ``root_id``, only that span and its descendants.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        if root_id is not None:
+            keep = {root_id}
+            for s in sorted(spans, key=lambda s: s.start_ns):
+                if s.parent_id in keep:
+                    keep.add(s.span_id)
+            spans = [s for s in spans if s.span_id in keep]
+        return [self._timing(s) for s in sorted(spans, key=lambda s: s.start_ns)]
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The finished spans as an OTLP/JSON ExportTraceServiceRequest."""
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "integrata_trace"},
+                    "spans": [
+                        {
+                            "traceId": self.trace_id,
+                            "spanId": s.span_id,
+                            "parentSpanId": s.parent_id or "",
+                            "name": s.name,
+                            "kind": 1,
+                            "startTimeUnixNano": str(s.start_ns),
+                            "endTimeUnixNano": str(s.end_ns),
+                            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                            "status": {"code": 2, "message": s.error} if s.error else {},
+                        }
+                        for s in spans
+                    ],
+                }],
+            }],
+        }
+
+    def export(self, path: str):
+        """Append the trace to ``path`` as one OTLP/JSON line (the collector file-exporter format)."""
+        line = json.dumps(self.to_otlp())
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class _Activation:
+    def __init__(self, trace: Optional[Trace]):
+        self.trace = trace
+        self._token = None
+
+    def __enter__(self):
+        if self.trace is not None:
+            self._token = _current.set((self.trace, None))
+        return self.trace
+
+    def __exit__(self, *exc):
+        if self._token is not None:
+            _current.reset(self._token)
+        return False
+
+
+def activate(trace: Optional[Trace]) -> _Activation:
+    """Trace.activate() that also accepts None (and then does nothing)."""
+    return _Activation(trace)
+
+
+def submit(pool, fn, *args, **kwargs):
+    """``pool.submit`` that carries the active trace over to the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
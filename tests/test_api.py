@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import integrata_cache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_servers import MockLlamaServer  # noqa: E402
+
+LATENCY = 0.3
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """integrata_llama_api pointed at a mock Llama API that takes LATENCY seconds per call."""
+    server = MockLlamaServer(latency=LATENCY).start()
+    saved = {name: os.environ.get(name) for name in ("LLAMA_API_KEY", "LLAMA_API_CLIENT_BASE_URL")}
+    os.environ.update(LLAMA_API_KEY="test", LLAMA_API_CLIENT_BASE_URL=server.base_url)
+    cache_dir = integrata_cache.DEFAULT_CACHE_DIR
+    integrata_cache.DEFAULT_CACHE_DIR = str(tmp_path_factory.mktemp("cache"))
+    try:
+        import integrata_llama_api
+        yield integrata_llama_api
+    finally:
+        integrata_cache.DEFAULT_CACHE_DIR = cache_dir
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        server.stop()
+
+
+def _post(api, path, payload):
+    async def main():
+        async with AsyncClient(transport=ASGITransport(app=api.app), base_url="http://test") as client:
+            return await client.post(path, json=payload)
+    return asyncio.run(main())
+
+
+def test_streamed_requests_are_timed_until_the_body_is_sent(api):
+    response = _post(api, "/chat", {"message": "hello", "stream": True})
+    assert response.status_code == 200
+    assert response.text.rstrip().endswith("data: [DONE]")
+    assert api.metrics.in_flight._values[("/chat",)] == 0
+    counts = api.metrics.requests._values[("/chat", "POST", "200")]
+    assert sum(counts[:-1]) == 1
+    assert counts[-1] >= LATENCY  # the upstream call runs while the body streams
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_session_errors_have_the_same_status_when_streaming(api, stream):
+    assert _post(api, "/chat/session/unknown", {"message": "hi", "stream": stream}).status_code == 404
+    session = api.llama.create_session()
+    session.begin_turn()
+    try:
+        assert _post(api, f"/chat/session/{session.session_id}", {"message": "hi", "stream": stream}).status_code == 409
+    finally:
+        session.end_turn()
+    assert _post(api, f"/chat/session/{session.session_id}", {"message": "hi", "stream": stream}).status_code == 200
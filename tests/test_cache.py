@@ -0,0 +1,101 @@
+import json
+from types import SimpleNamespace
+
+import integrata_cache
+from integrata_cache import _PAGE_ROW_BYTES, CompletionCache, IntentCache, PageCache, _total_size
+
+
+def test_intent_cache_ignores_case_and_punctuation():
+    cache = IntentCache()
+    cache.set("Search the web for cats, and check it's safe", ["moderate", "web_search"])
+    assert cache.get("search the web for cats and check it s safe!") == ["moderate", "web_search"]
+
+
+def test_intent_cache_keeps_intent_words_and_order():
+    cache = IntentCache()
+    cache.set("can you tell me what the weather will be like in Paris this weekend", ["weather"])
+    assert cache.get("can you tell me what the news will be like in Paris this weekend") is None
+    cache.set("do not moderate this just search the web for cats", ["web_search"])
+    assert cache.get("moderate this do not just search the web for cats") is None
+    assert cache.misses == 2
+
+
+def _clock(monkeypatch, start=1000.0):
+    """Drive integrata_cache's time.time() by hand; returns a one-item list holding now."""
+    now = [start]
+    monkeypatch.setattr(integrata_cache, "time", SimpleNamespace(time=lambda: now[0], monotonic=lambda: now[0]))
+    return now
+
+
+def _rows(cache, table):
+    return [key for (key,) in cache._conn.execute(f"SELECT key FROM {table} ORDER BY key")]
+
+
+def test_page_cache_counts_rows_without_text(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.sqlite3"), max_bytes=3 * _PAGE_ROW_BYTES)
+    for i in range(1000):
+        cache.put(f"https://example.com/{i}", None)
+    assert len(_rows(cache, "pages")) == 3
+    assert cache._size == _total_size(cache._conn, "pages") <= cache.max_bytes
+
+
+def test_page_cache_running_size_survives_replaces(tmp_path):
+    path = str(tmp_path / "pages.sqlite3")
+    cache = PageCache(path, max_bytes=10 * 1024)
+    for i in range(200):
+        cache.put(f"https://example.com/{i % 7}", "x" * (i * 37 % 900), etag=str(i))
+        assert cache._size == _total_size(cache._conn, "pages")
+    assert cache._size <= cache.max_bytes
+    assert PageCache(path, max_bytes=10 * 1024)._size == cache._size
+
+
+def test_page_cache_ttl_and_lru_with_batched_touches(tmp_path, monkeypatch):
+    now = _clock(monkeypatch)
+    cache = PageCache(str(tmp_path / "pages.sqlite3"), ttl=60, max_bytes=3 * (_PAGE_ROW_BYTES + 4))
+    for name in "abc":
+        cache.put(f"https://example.com/{name}", "text")
+        now[0] += 1
+    assert cache.get("https://example.com/a")["fresh"]  # touch is only recorded in memory
+    now[0] += 1
+    cache.put("https://example.com/d", "text")
+    # "a" was read after "b" was written, so "b" is the least recently used
+    assert _rows(cache, "pages") == ["https://example.com/a", "https://example.com/c", "https://example.com/d"]
+    now[0] += 60
+    assert not cache.get("https://example.com/d")["fresh"]
+    cache.touch("https://example.com/d")
+    assert cache.get("https://example.com/d")["fresh"]
+
+
+def test_completion_cache_running_size_survives_replaces(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    cache = CompletionCache(path, max_bytes=4 * 1024)
+    for i in range(300):
+        cache.put(f"key{i % 11}", {"text": "x" * (i * 53 % 700)})
+        assert cache._size == _total_size(cache._conn, "completions")
+    assert cache._size <= cache.max_bytes
+    assert CompletionCache(path)._size == cache._size
+
+
+def test_completion_cache_memory_tier_is_bounded(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"), max_entries=2)
+    for name in "abc":
+        cache.put(name, {"text": name})
+    assert list(cache._memory) == ["b", "c"]
+    # "a" is still on disk; reading it brings it back and evicts the oldest entry
+    assert cache.get("a") == {"text": "a"}
+    assert list(cache._memory) == ["c", "a"]
+
+
+def test_completion_cache_ttl_and_lru_with_batched_touches(tmp_path, monkeypatch):
+    now = _clock(monkeypatch)
+    blob = len(json.dumps({"text": "a"}))
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"), ttl=60, max_entries=1, max_bytes=3 * blob)
+    for name in "abc":
+        cache.put(name, {"text": name})
+        now[0] += 1
+    assert cache.get("a") == {"text": "a"}  # from disk; its touch is only recorded in memory
+    now[0] += 1
+    cache.put("d", {"text": "d"})
+    assert _rows(cache, "completions") == ["a", "c", "d"]
+    now[0] += 60
+    assert cache.get("d") is None and cache.get("c") is None
@@ -0,0 +1,132 @@
+import asyncio
+
+from integrata_concurrency import AsyncSingleFlight, ProgressTracker, async_batch_runner
+
+
+def test_concurrent_callers_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.coalesced == 4
+
+
+def test_call_survives_while_a_caller_remains():
+    flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_call_is_cancelled_with_its_last_caller():
+    flight = AsyncSingleFlight()
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        callers = [asyncio.ensure_future(flight.do("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        # a new caller starts a fresh call instead of joining the cancelled one
+        return await asyncio.wait_for(flight.do("key", asyncio.sleep, 0, "fresh"), 1)
+
+    assert asyncio.run(main()) == "fresh"
+    assert cancelled == [True]
+
+
+def _value(value, delay=0.0, running=None):
+    async def call():
+        if running is not None:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(delay)
+        if running is not None:
+            running["now"] -= 1
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return call
+
+
+def test_batch_runner_is_a_sliding_window():
+    running = {"now": 0, "peak": 0}
+    finished = []
+
+    def fast(i):
+        async def call():
+            await _value(i, 0.01, running)()
+            finished.append(i)
+            return i
+        return call
+
+    async def main():
+        slow = _value("slow", 0.3, running)
+        return await async_batch_runner([slow] + [fast(i) for i in range(10)], batch_size=2)
+
+    results = asyncio.run(main())
+    assert results == ["slow"] + list(range(10))
+    # The fast calls all ran beside the slow one rather than waiting on a batch barrier
+    assert finished == list(range(10))
+    assert running["peak"] == 2
+
+
+def test_batch_runner_keeps_order_and_exceptions_in_place():
+    error = ValueError("boom")
+    callables = [_value("a", 0.03), _value(error, 0.01), _value("c", 0.0)]
+    results = asyncio.run(async_batch_runner(callables, batch_size=3))
+    assert results == ["a", error, "c"]
+
+
+def test_batch_runner_follow_ups_are_bounded_by_max_loops():
+    def loop_fn(results):
+        return [_value(results[0] + 1)]
+
+    callables = [_value(0), _value(10), _value(ValueError("no follow-up"))]
+    results = asyncio.run(async_batch_runner(callables, loop_fn=loop_fn, max_loops=3))
+    assert results[:2] == [0, 10]
+    assert isinstance(results[2], ValueError)
+    # Each successful result gets one follow-up per generation, appended in completion order
+    assert sorted(results[3:]) == [1, 2, 11, 12]
+    assert asyncio.run(async_batch_runner([_value(0)], loop_fn=loop_fn, max_loops=1)) == [0]
+
+
+def test_batch_runner_reports_progress():
+    tracker = ProgressTracker()
+    updates = []
+    tracker.register_callback(updates.append)
+
+    def loop_fn(results):
+        return [_value("follow-up")] if results[0] == "a" else []
+
+    callables = [_value("a"), _value(ValueError("boom"))]
+    asyncio.run(async_batch_runner(callables, tracker=tracker, loop_fn=loop_fn, max_loops=2))
+    assert (tracker.calls_sent, tracker.calls_completed, tracker.errors) == (3, 2, 1)
+    assert updates[-1] == {"calls_sent": 3, "calls_completed": 2, "errors": 1}
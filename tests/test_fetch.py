@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+import threading
+
+from integrata_cache import PageCache
+from integrata_fetch import AsyncPageFetcher, PageFetcher, _HostSlots
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_servers import MockWebServer  # noqa: E402
+
+BAD_URL = "http://example.com:99999/x"  # no cache key: urlsplit() rejects the port
+
+
+def test_unkeyable_url_is_a_failed_fetch(tmp_path):
+    fetcher = PageFetcher(cache=PageCache(str(tmp_path / "pages.sqlite3")))
+    assert fetcher.fetch_text(BAD_URL) is None
+    assert fetcher.failed == 1
+
+
+def test_async_unkeyable_url_is_a_failed_fetch(tmp_path):
+    fetcher = AsyncPageFetcher(cache=PageCache(str(tmp_path / "pages.sqlite3")))
+
+    async def main():
+        try:
+            return await fetcher.fetch_text(BAD_URL)
+        finally:
+            await fetcher.aclose()
+
+    assert asyncio.run(main()) is None
+    assert fetcher.failed == 1
+
+
+def test_host_slots_are_dropped_when_idle():
+    slots = _HostSlots(per_host=1)
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        with slots.hold("https://a.example/1"):
+            entered.set()
+            release.wait()
+
+    worker = threading.Thread(target=hold)
+    worker.start()
+    entered.wait()
+    with slots.hold("https://b.example/1"):
+        assert len(slots) == 2
+    assert len(slots) == 1
+    release.set()
+    worker.join()
+    assert len(slots) == 0
+
+
+def test_async_client_is_closed_with_its_loop():
+    fetcher = AsyncPageFetcher()
+    clients = []
+    with MockWebServer() as web:
+        for i in range(2):
+            assert asyncio.run(fetcher.fetch_text(f"{web.url}/page/{i}"))
+            clients.append(fetcher._client)
+    assert clients[0] is not clients[1]
+    assert all(client.is_closed for client in clients)
+    assert len(fetcher._host_slots) == 0
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from llama_api_client import APIConnectionError
+from pydantic import ValidationError
+
+from integrata_cache import IntentCache
+from integrata_llama import IntegrataLlama, _dedupe_hits
+
+
+def test_dedupe_shares_normalized_urls_and_keeps_bad_ones_apart():
+    hits = {
+        "a": [{"href": "https://Example.com/page?utm_source=x"}, {"href": "http://example.com:99999/x"}],
+        "b": [{"href": "https://example.com/page"}, {"href": "http://example.com:99999/x"}],
+    }
+    unique, keys_by_query = _dedupe_hits(hits)
+    assert keys_by_query["a"][0] == keys_by_query["b"][0]
+    assert keys_by_query["a"][1] == "a#2" and keys_by_query["b"][1] == "b#2"
+    assert len(unique) == 3
+
+
+def _router(answers):
+    """An IntegrataLlama whose router model gives ``answers`` in turn (raising the exceptions)."""
+    llama = IntegrataLlama.__new__(IntegrataLlama)
+    llama.intent_cache = IntentCache()
+    llama._router_failed_at = None
+
+    def create(**params):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return SimpleNamespace(completion_message=SimpleNamespace(content=SimpleNamespace(text=answer)))
+    llama.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return llama
+
+
+def test_a_bad_router_answer_does_not_disable_the_router():
+    llama = _router(['{"intents": ["dance"]}', '{"intents": ["weather"]}'])
+    with pytest.raises(ValidationError):
+        llama.classify_intents("first")
+    assert llama.classify_intents("weather in Paris") == (["weather"], "model")
+
+
+def test_a_failed_router_call_backs_off():
+    error = APIConnectionError(request=httpx.Request("POST", "https://api.llama.com/v1/chat/completions"))
+    llama = _router([error, '{"intents": ["weather"]}'])
+    with pytest.raises(APIConnectionError):
+        llama.classify_intents("first")
+    with pytest.raises(RuntimeError):
+        llama.classify_intents("weather in Paris")
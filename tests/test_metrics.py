@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from integrata_metrics import QuantileSketch, RollingRate
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_are_within_relative_accuracy(relative_accuracy):
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-2, 1.5) for _ in range(20000)]
+    sketch = QuantileSketch(relative_accuracy=relative_accuracy)
+    for value in values:
+        sketch.add(value)
+    values.sort()
+    for q in (0.5, 0.95, 0.99):
+        true = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - true) <= relative_accuracy * true * (1 + 1e-9)
+    assert sketch.mean() == pytest.approx(sum(values) / len(values))
+
+
+def test_out_of_range_values_are_clamped():
+    sketch = QuantileSketch(relative_accuracy=0.01, min_value=1e-3, max_value=10)
+    for value in (0.0, 1e-9, 1e6):
+        sketch.add(value)
+    assert sketch.count == 3
+    assert sketch.quantile(0) == pytest.approx(1e-3, rel=0.01)
+    assert sketch.quantile(1) == pytest.approx(10, rel=0.01)
+    assert QuantileSketch().quantile(0.5) == 0.0
+
+
+def test_rolling_rate_expires_old_slots():
+    rate = RollingRate(window=3)
+    rate.add(6, now=100.2)
+    assert rate.rate(now=100.9) == 2
+    assert rate.rate(now=102.9) == 2
+    assert rate.rate(now=103.0) == 0
+    # The slot second 100 used is reset, not added to, when second 103 reuses it
+    rate.add(3, now=103.5)
+    assert rate.rate(now=103.5) == 1
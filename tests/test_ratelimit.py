@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from llama_api_client import APITimeoutError, InternalServerError
+
+from integrata_ratelimit import AIMDLimiter, RateLimiter
+
+
+async def _slow(**params):
+    await asyncio.sleep(10)
+
+
+async def _fast(**params):
+    return "ok"
+
+
+def test_cancelled_calls_release_their_slots():
+    limiter = RateLimiter(initial_concurrency=8)
+
+    async def main():
+        tasks = [asyncio.ensure_future(limiter.async_call(_slow)) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert limiter.concurrency.in_flight == 0
+        assert await asyncio.wait_for(limiter.async_call(_fast), 1) == "ok"
+
+    asyncio.run(main())
+    assert limiter.concurrency.limit >= 8
+
+
+def _request():
+    return httpx.Request("POST", "https://api.llama.com/v1/chat/completions")
+
+
+def _failing(error, calls):
+    async def create(**params):
+        calls.append(params)
+        raise error
+    return create
+
+
+def test_timeouts_are_not_retried():
+    limiter = RateLimiter(base_delay=0)
+    calls = []
+    with pytest.raises(APITimeoutError):
+        asyncio.run(limiter.async_call(_failing(APITimeoutError(_request()), calls), timeout=0.5))
+    assert len(calls) == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_server_errors_are_retried():
+    limiter = RateLimiter(base_delay=0, max_retries=2)
+    calls = []
+    error = InternalServerError("boom", response=httpx.Response(500, request=_request()), body=None)
+    with pytest.raises(InternalServerError):
+        asyncio.run(limiter.async_call(_failing(error, calls)))
+    assert len(calls) == 3
+    assert limiter.retries == 2
+
+
+def test_waiters_are_woken_without_polling():
+    limiter = AIMDLimiter(initial=1, maximum=1)
+    order = []
+
+    async def worker(i):
+        await limiter.async_acquire()
+        order.append(i)
+        await asyncio.sleep(0)
+        limiter.release()
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(*(worker(i) for i in range(200)))
+        return time.monotonic() - started
+
+    # 200 hand-offs with a 20ms poll would take seconds
+    assert asyncio.run(main()) < 0.5
+    assert order == list(range(200))
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    limiter = AIMDLimiter(initial=1, maximum=1)
+
+    async def main():
+        await limiter.async_acquire()
+        first = asyncio.ensure_future(limiter.async_acquire())
+        second = asyncio.ensure_future(limiter.async_acquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        limiter.release()
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+
+
+def test_threads_and_coroutines_share_the_limit():
+    limiter = AIMDLimiter(initial=2, maximum=2)
+    peak = []
+
+    def hold():
+        limiter.acquire()
+        peak.append(limiter.in_flight)
+        time.sleep(0.01)
+        limiter.release()
+
+    async def main():
+        threads = [threading.Thread(target=hold) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for _ in range(5):
+            await limiter.async_acquire()
+            peak.append(limiter.in_flight)
+            await asyncio.sleep(0.01)
+            limiter.release()
+        for t in threads:
+            t.join()
+
+    asyncio.run(main())
+    assert max(peak) <= 2
+    assert limiter.in_flight == 0
+
+
+def test_timing_covers_only_the_successful_attempt():
+    limiter = RateLimiter(base_delay=0)
+    limiter._backoff = lambda attempt, error: 0.2
+    error = InternalServerError("boom", response=httpx.Response(500, request=_request()), body=None)
+    calls = []
+
+    async def flaky(**params):
+        calls.append(params)
+        if len(calls) == 1:
+            raise error
+        return "ok"
+
+    before = time.monotonic()
+    response, started = asyncio.run(limiter.async_call_timed(flaky))
+    assert response == "ok"
+    assert started - before >= 0.2
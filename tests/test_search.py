@@ -0,0 +1,21 @@
+import pytest
+
+import integrata_cache
+from integrata_search import SearchStack
+from integrata_tokens import UsageTracker
+
+
+def test_from_env_requires_a_key(monkeypatch):
+    monkeypatch.delenv("LLAMA_API_KEY", raising=False)
+    with pytest.raises(RuntimeError):
+        SearchStack.from_env()
+
+
+def test_fetcher_shares_the_page_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(integrata_cache, "DEFAULT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("LLAMA_API_KEY", "test-key")
+    usage = UsageTracker()
+    stack = SearchStack.from_env(usage)
+    assert stack.fetcher.cache is stack.page_cache
+    assert stack.fetcher.extractor is stack.extractor
+    assert stack.client.usage is usage
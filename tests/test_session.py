@@ -0,0 +1,40 @@
+from integrata_session import ChatSession
+
+
+def _session(max_history_tokens=400):
+    session = ChatSession("s", max_history_tokens=max_history_tokens, keep_turns=1)
+    for i in range(6):
+        session.add_exchange(f"question {i} " + "word " * 40, f"answer {i} " + "word " * 40)
+    return session
+
+
+def test_compaction_folds_down_to_half_the_budget():
+    session = _session()
+    assert session.needs_compaction()
+    old = session.start_compaction()
+    assert old and len(old) % 2 == 0
+    session.fold(len(old), "summary")
+    session.end_compaction()
+    assert sum(session._tokens) <= session.max_history_tokens // 2
+    assert len(session.turns) >= 2
+    # The next turn fits without another compaction
+    session.add_exchange("short", "reply")
+    assert not session.needs_compaction()
+
+
+def test_compaction_keeps_the_last_exchanges():
+    session = _session(max_history_tokens=10)
+    old = session.start_compaction()
+    assert len(old) == len(session.turns) - 2
+
+
+def test_one_compaction_at_a_time_and_new_turns_survive_it():
+    session = _session()
+    old = session.start_compaction()
+    assert session.start_compaction() is None
+    session.add_exchange("during", "compaction")
+    session.fold(len(old), "summary")
+    session.end_compaction()
+    assert session.turns[-2:] == [{"role": "user", "content": "during"},
+                                  {"role": "assistant", "content": "compaction"}]
+    assert session.turns[0] not in old
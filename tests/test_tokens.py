@@ -0,0 +1,23 @@
+from integrata_tokens import count_tokens, split_tokens, truncate_tokens
+
+TEXT = "\n".join(f"Paragraph {i}: " + "words and more words " * (i % 7 * 2) for i in range(60))
+
+
+def test_chunks_keep_paragraphs_whole_within_the_budget():
+    chunks = split_tokens(TEXT, 200)
+    assert len(chunks) > 3
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    assert "\n".join(chunks) == TEXT
+
+
+def test_truncate_and_max_chunks_only_take_the_leading_chunks():
+    chunks = split_tokens(TEXT, 200)
+    assert truncate_tokens(TEXT, 200) == chunks[0]
+    assert split_tokens(TEXT, 200, max_chunks=2) == chunks[:2]
+    assert truncate_tokens("", 200) == ""
+
+
+def test_long_paragraphs_are_split_mid_text():
+    chunks = split_tokens("word " * 1000, 100)
+    assert len(chunks) >= 10
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)